@@ -0,0 +1,135 @@
+"""
+Inference backends (modelCache.BACKENDS) against the fp32 pipeline, for
+the summariser and the generator: load time, resident memory, generate
+latency and how far each backend's output drifts from fp32.
+
+Every (model, backend) pair runs in its own process, so memory is not
+shared between them and each load starts cold apart from the converted
+artifacts cached under .models/ (run twice to see warm loads). "first s"
+is the first generate call, which includes compilation for "compile".
+
+Drift is measured on one forward pass (max |logit - fp32 logit|) and on
+greedy output (share of generated tokens equal to fp32 at the same
+position, stopping at the first divergence).
+
+    python benchmarks/bench_backends.py [--backends fp32 int8 compile onnx] [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+MODELS = {
+    "summarization":   "sshleifer/distilbart-cnn-6-6",
+    "text-generation": "EleutherAI/gpt-neo-125M",
+}
+PROMPT_TOKENS = {"summarization": 600, "text-generation": 512}
+NEW_TOKENS = 64
+PARAGRAPH = (
+    "Photosynthesis converts light energy into chemical energy in the chloroplast. "
+    "The light-dependent reactions split water and release oxygen, while the Calvin "
+    "cycle fixes carbon dioxide into sugars using ATP and NADPH. "
+)
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def runWorker(task: str, backend: str, runs: int, out: Path):
+    import torch
+    from modelCache import load_pipeline
+
+    baseline = rss()
+    start = time.perf_counter()
+    pipe = load_pipeline(task, MODELS[task], backend=backend)
+    loadSeconds = time.perf_counter() - start
+    model, tokenizer = pipe.model, pipe.tokenizer
+
+    ids = tokenizer.encode(PARAGRAPH * 40, add_special_tokens=False)[:PROMPT_TOKENS[task]]
+    if task == "summarization":
+        ids = tokenizer.build_inputs_with_special_tokens(ids)
+    inputs = {"input_ids": torch.tensor([ids]), "attention_mask": torch.ones(1, len(ids), dtype=torch.long)}
+    genKwargs = dict(max_new_tokens=NEW_TOKENS, min_new_tokens=NEW_TOKENS, do_sample=False,
+                     num_beams=1, no_repeat_ngram_size=3, pad_token_id=tokenizer.eos_token_id)
+
+    with torch.inference_mode():
+        forward = dict(inputs)
+        if task == "summarization":
+            forward["decoder_input_ids"] = torch.tensor([[model.config.decoder_start_token_id]])
+        logits = model(**forward).logits[0, -1].float().numpy()
+
+        start = time.perf_counter()
+        output = model.generate(**inputs, **genKwargs)
+        firstSeconds = time.perf_counter() - start
+
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            model.generate(**inputs, **genKwargs)
+            timings.append(time.perf_counter() - start)
+
+    generated = output[0, -NEW_TOKENS:] if task == "text-generation" else output[0]
+    np.savez(out, logits=logits, tokens=generated.numpy())
+    with open("/proc/self/status") as f:
+        peak = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM"))
+    print(json.dumps({"load": loadSeconds, "first": firstSeconds, "median": statistics.median(timings),
+                      "rss": rss() - baseline, "peak": peak}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["fp32", "int8", "compile", "onnx"])
+    parser.add_argument("--runs", type=int, default=5, help="timed generate calls per backend")
+    parser.add_argument("--worker", nargs=2, metavar=("TASK", "BACKEND"), help=argparse.SUPPRESS)
+    parser.add_argument("--out", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        runWorker(*args.worker, args.runs, args.out)
+        return
+
+    backends = ["fp32"] + [b for b in args.backends if b != "fp32"]
+    with tempfile.TemporaryDirectory() as tmp:
+        for task, modelId in MODELS.items():
+            print(f"\n{modelId}")
+            print(f"{'backend':>8} {'load s':>7} {'first s':>8} {'median s':>9} {'tok/s':>7} "
+                  f"{'RSS MB':>7} {'peak MB':>8} {'max Δlogit':>11} {'token match':>12}")
+            reference = None
+            for backend in backends:
+                out = Path(tmp) / f"{task}-{backend}.npz"
+                proc = subprocess.run([sys.executable, __file__, "--worker", task, backend,
+                                       "--runs", str(args.runs), "--out", str(out)],
+                                      capture_output=True, text=True)
+                if proc.returncode != 0:
+                    print(f"{backend:>8} failed: {proc.stderr.strip().splitlines()[-1]}")
+                    continue
+                result = json.loads(proc.stdout.strip().splitlines()[-1])
+                arrays = np.load(out)
+                if reference is None:
+                    reference = arrays
+                drift = float(np.abs(arrays["logits"] - reference["logits"]).max())
+                matching = 0
+                for mine, theirs in zip(arrays["tokens"], reference["tokens"]):
+                    if mine != theirs:
+                        break
+                    matching += 1
+                print(f"{backend:>8} {result['load']:>7.2f} {result['first']:>8.2f} {result['median']:>9.3f} "
+                      f"{NEW_TOKENS / result['median']:>7.1f} {result['rss'] / 2**20:>7.0f} "
+                      f"{result['peak'] / 2**20:>8.0f} {drift:>11.4f} "
+                      f"{matching / len(reference['tokens']):>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+End-to-end benchmark of the /generate flow.
+
+Builds a fixed synthetic corpus (text PDFs, text images and optionally WAV
+audio) from a seed, stores it in an in-process mongomock GridFS and runs
+POST /generate for 1/2/4/8 concurrent sessions over small, medium and
+large inputs. Every scenario starts with empty extraction and prefix
+caches. For each scenario it reports request latency percentiles,
+throughput, per-stage time (from the per-request metrics log) and peak RSS
+while each progress stage was active.
+
+/generate chunks the context rather than compressing it, so
+`--compress` additionally times llmUtils._compress_if_needed on each
+size's text. Audio is off by default because it downloads the ASR model
+on first use; images need the tesseract binary.
+
+    python benchmarks/bench_endToEnd.py [--sizes small,medium] [--sessions 1,2,4,8]
+                                        [--types 1] [--media pdf,image] [--compress]
+                                        [--out results.json]
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import wave
+from pathlib import Path
+
+TMP = tempfile.mkdtemp(prefix="smartstudy-bench-")
+METRICS_LOG = os.path.join(TMP, "requests.jsonl")
+
+# must be set before main / metrics are imported
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")   # replaced by mongomock, never contacted
+os.environ.setdefault("LLM_API_KEY", "bench")
+os.environ["METRICS_JSON_LOG"] = METRICS_LOG
+os.environ["EXTRACT_CACHE_DIR"] = os.path.join(TMP, "extracted")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import gridfs  # noqa: E402
+import mongomock  # noqa: E402
+import mongomock.gridfs  # noqa: E402
+from bson import ObjectId  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from fpdf import FPDF  # noqa: E402
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+mongomock.gridfs.enable_gridfs_integration()
+
+import llmUtils  # noqa: E402
+import main as service  # noqa: E402
+from sessionArtifacts import SessionArtifacts  # noqa: E402
+from resultCache import ResultCache  # noqa: E402
+from transcriptCache import TranscriptCache  # noqa: E402
+from tokenDoc import TokenizedText  # noqa: E402
+
+SIZES = {
+    "small":  {"pdfs": 1, "pages": 2,  "images": 0, "audio": 0},
+    "medium": {"pdfs": 2, "pages": 8,  "images": 1, "audio": 1},
+    "large":  {"pdfs": 4, "pages": 30, "images": 2, "audio": 1},
+}
+GENERATION_TYPES = ["studyGuide", "flashcards", "practiceTest", "keyTerms"]
+POLL_SECONDS = 0.05
+
+SENTENCES = [
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "The Calvin cycle fixes carbon dioxide using ATP and NADPH from the light reactions.",
+    "Mitochondria release energy from glucose through cellular respiration.",
+    "Enzymes lower the activation energy of reactions without being consumed.",
+    "DNA replication is semi-conservative: each new helix keeps one parent strand.",
+    "Osmosis moves water across a membrane toward the higher solute concentration.",
+    "Natural selection acts on heritable variation within a population.",
+    "The electron transport chain pumps protons to build a gradient across the membrane.",
+    "Meiosis halves the chromosome number and shuffles alleles by crossing over.",
+    "Homeostasis keeps internal conditions stable through negative feedback loops.",
+]
+
+
+# ---------------------------------------------------------------------
+#  Corpus
+# ---------------------------------------------------------------------
+def paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(rng.choice(SENTENCES) for _ in range(sentences))
+
+
+def makePdf(rng: random.Random, pages: int) -> bytes:
+    pdf = FPDF()
+    pdf.set_font("Arial", size=11)
+    for page in range(pages):
+        pdf.add_page()
+        pdf.multi_cell(0, 6, f"Lecture notes, page {page + 1}\n\n" + paragraph(rng, 30))
+    out = pdf.output(dest="S")
+    return out.encode("latin-1") if isinstance(out, str) else bytes(out)
+
+
+def makeImage(rng: random.Random) -> bytes:
+    image = Image.new("RGB", (1400, 900), "white")
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.load_default(size=28)
+    except TypeError:                        # Pillow < 10.1 has one fixed size
+        font = ImageFont.load_default()
+    for line in range(12):
+        draw.text((40, 40 + line * 60), rng.choice(SENTENCES)[:80], fill="black", font=font)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def makeWav(rng: random.Random, seconds: float = 5.0, rate: int = 16000) -> bytes:
+    # tones, not speech: exercises upload, spooling and the audio path only
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(bytes(rng.getrandbits(8) for _ in range(int(seconds * rate) * 2)))
+    return buffer.getvalue()
+
+
+def createSession(fs, users, rng: random.Random, size: str, media: set, types: int) -> str:
+    spec = SIZES[size]
+    uploads = []
+
+    def store(name: str, content: bytes, contentType: str):
+        fileId = fs.put(content, filename=name, content_type=contentType)
+        uploads.append({"fileName": name, "gridFsId": str(fileId), "fileType": contentType})
+
+    if "pdf" in media:
+        for i in range(spec["pdfs"]):
+            store(f"notes{i}.pdf", makePdf(rng, spec["pages"]), "application/pdf")
+    if "image" in media:
+        for i in range(spec["images"]):
+            store(f"board{i}.png", makeImage(rng), "image/png")
+    if "audio" in media:
+        for i in range(spec["audio"]):
+            store(f"lecture{i}.wav", makeWav(rng), "audio/wav")
+
+    sessionId = ObjectId()
+    users.insert_one({"username": f"bench-{sessionId}", "sessions": [{
+        "_id": sessionId,
+        "instructions": "Focus on the key processes and definitions.",
+        "uploadedFiles": uploads,
+        "generationList": GENERATION_TYPES[:types],
+        "configMap": [json.dumps({})],
+    }]})
+    return str(sessionId)
+
+
+# ---------------------------------------------------------------------
+#  Measurement
+# ---------------------------------------------------------------------
+def rss() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class StageMemory:
+    """
+    Peak RSS seen while each stage returned by `activeStages` was active,
+    sampled every 20 ms and whenever sample() is called (on each progress
+    update, so stages shorter than the interval are seen too).
+    """
+
+    def __init__(self, activeStages):
+        self.activeStages = activeStages
+        self.peaks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        current = rss()
+        stages = self.activeStages() - {None}
+        with self._lock:
+            for stage in stages:
+                self.peaks[stage] = max(self.peaks.get(stage, 0), current)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            time.sleep(0.02)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]     # nearest rank
+
+
+def resetCaches():
+    # in place: main, /cache/stats and the metrics collectors hold these objects
+    service.extract_cache.clear()
+    service.prefix_cache.clear()
+
+
+def readTraces(offset: int):
+    with open(METRICS_LOG) as f:
+        f.seek(offset)
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def runScenario(client, fs, users, size: str, sessions: int, types: int, media: set, seed: int) -> dict:
+    rng = random.Random(f"{seed}-{size}-{sessions}")
+    resetCaches()
+    sessionIds = [createSession(fs, users, rng, size, media, types) for _ in range(sessions)]
+    offset = os.path.getsize(METRICS_LOG) if os.path.exists(METRICS_LOG) else 0
+
+    def progressStages():
+        # the request-level stage plus each generation type's own (render, upload, ...)
+        stages = set()
+        with service.progress_lock:
+            for sid in sessionIds:
+                entry = service.progress_store.get(sid, {})
+                stages.add(entry.get("stage"))
+                stages.update(generation.get("stage") for generation in entry.get("generations", {}).values())
+        return stages
+
+    publishProgress = service.publishProgress
+
+    def publishAndSample(*args, **kwargs):
+        publishProgress(*args, **kwargs)
+        memory.sample()
+
+    submitted, finished, failed = {}, {}, 0
+    with StageMemory(progressStages) as memory:
+        service.publishProgress = publishAndSample
+        try:
+            start = time.perf_counter()
+            for sid in sessionIds:
+                response = client.post("/generate", json={"sessionId": sid, "apiKey": os.environ["LLM_API_KEY"]})
+                response.raise_for_status()
+                submitted[sid] = time.perf_counter()
+
+            while len(finished) < sessions:
+                for sid in sessionIds:
+                    if sid in finished:
+                        continue
+                    with service.progress_lock:
+                        state = service.progress_store.get(sid, {}).get("status")
+                    if state in ("done", "failed", "cancelled"):
+                        finished[sid] = time.perf_counter()
+                        failed += state != "done"
+                time.sleep(POLL_SECONDS)
+            wall = time.perf_counter() - start
+        finally:
+            service.publishProgress = publishProgress
+
+    latencies = [finished[sid] - submitted[sid] for sid in sessionIds]
+    stages = {}
+    for trace in readTraces(offset):
+        for stage, seconds in trace["stages"].items():
+            stages.setdefault(stage, []).append(seconds)
+
+    return {
+        "size": size,
+        "sessions": sessions,
+        "failed": failed,
+        "latency": {f"p{q}": percentile(latencies, q) for q in (50, 90, 99)},
+        "requestsPerMinute": sessions / wall * 60,
+        "stageSeconds": {stage: {"p50": percentile(v, 50), "p95": percentile(v, 95)}
+                         for stage, v in stages.items()},
+        "stagePeakRssMB": {stage: peak / 2**20 for stage, peak in memory.peaks.items()},
+    }
+
+
+def timeCompression(size: str, seed: int) -> dict:
+    spec = SIZES[size]
+    rng = random.Random(f"{seed}-{size}-compress")
+    text = TokenizedText("\n".join(paragraph(rng, 30) for _ in range(spec["pdfs"] * spec["pages"])))
+    tokens = text.count(llmUtils.generator.tokenizer)
+
+    with StageMemory(lambda: {"compress"}) as memory:
+        start = time.perf_counter()
+        compressed = llmUtils._compress_if_needed(text)
+        seconds = time.perf_counter() - start
+    return {"size": size, "tokensIn": tokens, "tokensOut": compressed.count(llmUtils.generator.tokenizer),
+            "seconds": seconds, "peakRssMB": memory.peaks.get("compress", 0) / 2**20}
+
+
+def report(result: dict):
+    latency = result["latency"]
+    print(f"\n== {result['size']}, {result['sessions']} concurrent session(s)"
+          f"{', %d failed' % result['failed'] if result['failed'] else ''}")
+    print(f"   latency p50 {latency['p50']:7.2f} s  p90 {latency['p90']:7.2f} s  p99 {latency['p99']:7.2f} s"
+          f"   throughput {result['requestsPerMinute']:6.2f} req/min")
+    print(f"   {'stage':<16} {'p50 s':>9} {'p95 s':>9} {'peak RSS MB':>12}")
+    for stage, seconds in result["stageSeconds"].items():
+        print(f"   {stage:<16} {seconds['p50']:>9.3f} {seconds['p95']:>9.3f}")
+    for stage, peak in result["stagePeakRssMB"].items():
+        print(f"   {'[' + stage + ']':<16} {'':>9} {'':>9} {peak:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="small,medium,large")
+    parser.add_argument("--sessions", default="1,2,4,8", help="concurrent sessions per scenario")
+    parser.add_argument("--types", type=int, default=1, help="generation types per session")
+    parser.add_argument("--media", default="pdf,image", help="any of pdf,image,audio")
+    parser.add_argument("--compress", action="store_true", help="also time _compress_if_needed per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    media = set(args.media.split(","))
+    db = mongomock.MongoClient()["studyAssistBench"]
+    service.db, service.users = db, db["users"]
+    service.fs = gridfs.GridFS(db, collection="uploads")
+    service.artifacts = SessionArtifacts(db["sessionArtifacts"])
+    service.result_cache = ResultCache(db["generationResults"])
+    service.transcripts = TranscriptCache(db["transcripts"])
+
+    print("Loading models …")
+    llmUtils.warm_up()
+
+    results = []
+    with TestClient(service.app) as client:
+        for size in args.sizes.split(","):
+            for sessions in (int(n) for n in args.sessions.split(",")):
+                results.append(runScenario(client, service.fs, service.users, size, sessions,
+                                           args.types, media, args.seed))
+                report(results[-1])
+
+    if args.compress:
+        print()
+        for size in args.sizes.split(","):
+            result = timeCompression(size, args.seed)
+            results.append({"compress": result})
+            print(f"== compress {size}: {result['tokensIn']} → {result['tokensOut']} tokens in "
+                  f"{result['seconds']:.2f} s, peak RSS {result['peakRssMB']:.1f} MB")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Session lookup benchmark: full users-collection scan vs. the indexed
+`sessions._id` query in sessionStore.
+
+mongomock ignores indexes (every query is a scan), so by default this runs
+against IndexedUsers, an in-memory stand-in that answers `sessions._id`
+queries through the index once it exists. Set BENCH_MONGODB_URL to use a
+real (throwaway) MongoDB instead; there the documents examined and the
+winning plan come from explain().
+
+Besides the time per lookup, each row reports the documents a lookup
+examines. The run fails if the indexed lookup examines more than one
+document at any size, or its time grows more than FLAT_TOLERANCE x from
+the smallest to the largest collection.
+
+    python benchmarks/bench_findSession.py
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from sessionStore import ensureSessionIndex, findSession  # noqa: E402
+
+USER_COUNTS = [100, 1_000, 10_000, 30_000]
+SESSIONS_PER_USER = 5
+LOOKUPS = 500
+FLAT_TOLERANCE = 3.0
+
+
+class IndexedUsers:
+    """
+    Just enough of a users collection for sessionStore and this benchmark,
+    with a real hash index on `sessions._id` once create_index is called.
+    `docsExamined` counts documents looked at, like explain()'s
+    totalDocsExamined.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.index = None          # session id -> user _ids
+        self.docsExamined = 0
+
+    def delete_many(self, filter):
+        assert filter == {}, "only clearing the collection is supported"
+        self.docs.clear()
+        self.index = None
+
+    def drop(self):
+        self.delete_many({})
+
+    def insert_many(self, docs):
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            self.docs[doc["_id"]] = doc
+            if self.index is not None:
+                self._indexDoc(doc)
+
+    def _indexDoc(self, doc):
+        for session in doc.get("sessions", []):
+            self.index.setdefault(session["_id"], []).append(doc["_id"])
+
+    def create_index(self, key):
+        assert key == "sessions._id", f"no stand-in index for {key}"
+        self.index = {}
+        for doc in self.docs.values():
+            self._indexDoc(doc)
+
+    def find(self, filter=None):
+        assert not filter, "only full scans are supported"
+        for doc in self.docs.values():
+            self.docsExamined += 1
+            yield doc
+
+    def find_one(self, filter, projection=None):
+        # findSession's query: {"sessions._id": id} with an $elemMatch projection
+        sessionId = filter["sessions._id"]
+        if self.index is not None:
+            candidates = (self.docs[userId] for userId in self.index.get(sessionId, []))
+        else:
+            candidates = self.docs.values()
+        for doc in candidates:
+            self.docsExamined += 1
+            session = next((s for s in doc.get("sessions", []) if s["_id"] == sessionId), None)
+            if session is not None:
+                return {"_id": doc["_id"], "sessions": [session]}
+        return None
+
+
+def scanSession(users, session_id: str):
+    # The lookup findSession used before the indexed query.
+    for user in users.find():
+        for session in user.get("sessions", []):
+            if str(session["_id"]) == session_id:
+                return session
+    return None
+
+
+def getCollection():
+    url = os.environ.get("BENCH_MONGODB_URL")
+    if url:
+        from pymongo import MongoClient
+        client = MongoClient(url)
+        return client["studyAssistBench"]["users"], "mongodb"
+    return IndexedUsers(), "indexed in-memory stand-in"
+
+
+def populate(users, count: int) -> list[str]:
+    users.delete_many({})
+    sessionIds = []
+    docs = []
+    for i in range(count):
+        sessions = []
+        for _ in range(SESSIONS_PER_USER):
+            sid = ObjectId()
+            sessionIds.append(str(sid))
+            sessions.append({
+                "_id": sid,
+                "name": f"session {i}",
+                "instructions": "Focus on chapter 3",
+                "uploadedFiles": [{"fileName": "notes.pdf", "gridFsId": str(ObjectId())}],
+            })
+        docs.append({"username": f"user{i}", "sessions": sessions})
+    users.insert_many(docs)
+    return sessionIds
+
+
+def timeLookups(fn, users, sessionIds: list[str], lookups: int) -> tuple[float, float]:
+    """Mean ms per lookup and, on the stand-in, mean documents examined per lookup."""
+    picks = random.sample(sessionIds, lookups)
+    examined = getattr(users, "docsExamined", 0)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # findSession logs every hit
+        for sid in picks:
+            assert fn(users, sid) is not None
+    ms = (time.perf_counter() - start) / lookups * 1000
+    return ms, (getattr(users, "docsExamined", 0) - examined) / lookups
+
+
+def explainLookup(users, session_id: str) -> tuple[float, str]:
+    """Documents examined and winning plan stages of findSession's query on a real server."""
+    objectId = ObjectId(session_id)
+    plan = users.find({"sessions._id": objectId},
+                      {"sessions": {"$elemMatch": {"_id": objectId}}}).limit(1).explain()
+    stages, stage = [], plan["queryPlanner"]["winningPlan"]
+    while stage:
+        stages.append(stage.get("stage", "?"))
+        stage = stage.get("inputStage")
+    return plan["executionStats"]["totalDocsExamined"], ">".join(stages)
+
+
+def main():
+    random.seed(0)
+    users, backend = getCollection()
+    print(f"Backend: {backend}")
+    print(f"{'users':>8} {'scan ms':>10} {'scan docs':>10} {'indexed ms':>12} {'indexed docs':>13}  plan")
+
+    rows = []
+    for count in USER_COUNTS:
+        sessionIds = populate(users, count)
+        # keep the slow path affordable on large collections
+        scanMs, scanDocs = timeLookups(scanSession, users, sessionIds, max(1, LOOKUPS // 100))
+        ensureSessionIndex(users)
+        indexedMs, indexedDocs = timeLookups(findSession, users, sessionIds, LOOKUPS)
+        plan = "index lookup"
+        if backend == "mongodb":
+            indexedDocs, plan = explainLookup(users, random.choice(sessionIds))
+            scanDocs = float("nan")
+        rows.append((count, indexedMs, indexedDocs))
+        print(f"{count:>8} {scanMs:>10.2f} {scanDocs:>10.0f} {indexedMs:>12.3f} {indexedDocs:>13.0f}  {plan}")
+
+    users.drop()
+
+    growth = rows[-1][1] / rows[0][1]
+    print(f"\nIndexed lookup time x{growth:.1f} from {rows[0][0]} to {rows[-1][0]} users; "
+          f"documents examined per lookup: {sorted({docs for _, _, docs in rows})}")
+    assert all(docs <= 1 for _, _, docs in rows), "indexed lookup examined more than one document"
+    assert growth <= FLAT_TOLERANCE, f"indexed lookup time grew x{growth:.1f} (> x{FLAT_TOLERANCE})"
+    print("✅ Indexed lookup stays flat")
+
+
+if __name__ == "__main__":
+    main()
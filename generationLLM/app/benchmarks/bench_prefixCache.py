@@ -0,0 +1,90 @@
+"""
+Time-to-first-token with and without the prompt-prefix KV cache.
+
+Builds one request's prompts the way getStudyContent does (shared header,
+context chunk, per-type question) and measures prefill + first token for
+every chunk of every generation type. Without the cache each prompt is
+computed from scratch; with it, only the question is new after the first
+type has seen a chunk.
+
+The default context is larger than the cache's PREFIX_CACHE_TOKENS budget,
+so plain LRU ("lru") cycles every entry out before the next type reaches
+it; "scoped" runs the request inside PrefixCache.scope() as /generate
+does, which keeps the request's entries (up to PREFIX_CACHE_MAX_TOKENS).
+
+    python benchmarks/bench_prefixCache.py [--chunks 12] [--types 4]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import llmUtils  # noqa: E402
+from prefixCache import PrefixCache  # noqa: E402
+
+HEADER = ("Your task is to generate a certain type of study content based on the context of "
+          "the files that have been provided and the general instructions which are: focus on "
+          "chapter 3. The content of the files is provided below.\n\n")
+TYPES = ["studyGuide", "flashcards", "practiceProblems", "keyTerms", "practiceTest", "summary"]
+SENTENCE = "Fact {}: enzymes lower the activation energy of reactions in the cell. "
+
+
+def firstToken(prompt, past=None) -> float:
+    model = llmUtils.generator.model
+    ids = torch.tensor([prompt], dtype=torch.long, device=model.device)
+    start = time.perf_counter()
+    model.generate(ids, attention_mask=torch.ones_like(ids), past_key_values=past,
+                   max_new_tokens=1, do_sample=False,
+                   pad_token_id=llmUtils.generator.tokenizer.eos_token_id)
+    return (time.perf_counter() - start) * 1000
+
+
+def runTypes(context: str, types: int, cache=None):
+    """Time to first token per prompt, split into the first type and later types."""
+    first, later = [], []
+    for t, generation in enumerate(TYPES[:types]):
+        parts = llmUtils.chunk_prompt_parts(context, f"Generate the {generation}.",
+                                            generation_tokens=600, header=HEADER)
+        for header, chunk, question in parts:
+            start = time.perf_counter()
+            past = cache.get([header, chunk]) if cache is not None else None
+            lookup = (time.perf_counter() - start) * 1000
+            (first if t == 0 else later).append(lookup + firstToken(header + chunk + question, past))
+    return first, later, len(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=12)
+    parser.add_argument("--types", type=int, default=4)
+    args = parser.parse_args()
+
+    tokenizer = llmUtils.generator.tokenizer
+    sentence_len = len(tokenizer.encode(SENTENCE.format(0)))
+    context = "".join(SENTENCE.format(i) for i in range(args.chunks * 1000 // sentence_len))
+
+    first, later, chunks = runTypes(context, args.types)
+    print(f"prompts: {chunks * args.types} ({args.types} types x {chunks} chunks)")
+    print(f"{'mode':<8} {'first type ms':>14} {'later types ms':>15} {'later hit rate':>15}  cache")
+    print(f"{'none':<8} {statistics.mean(first):>14.1f} {statistics.mean(later or [0]):>15.1f} {'-':>15}")
+
+    for mode in ("lru", "scoped"):
+        cache = PrefixCache(llmUtils.generator.model)
+        if mode == "scoped":
+            with cache.scope():
+                first, later, _ = runTypes(context, args.types, cache)
+        else:
+            first, later, _ = runTypes(context, args.types, cache)
+        stats = cache.stats()
+        laterHits = stats["hits"] / max(1, chunks * (args.types - 1))
+        print(f"{mode:<8} {statistics.mean(first):>14.1f} {statistics.mean(later or [0]):>15.1f} "
+              f"{laterHits:>15.0%}  {stats['entries']} entries, {stats['tokens']} tokens "
+              f"(budget {stats['maxTokens']}, pinned up to {stats['hardMaxTokens']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Peak RSS of a request's GridFS I/O: whole-file buffering vs. the
+streaming layer in gridfsStream.
+
+"before" replays what a request used to do: read every upload into memory
+and keep the bytes for the whole request, then write the rendered PDF to
+genResults/ and read it back into GridFS. "after" spools each upload
+chunk-wise to a temp file (hashing it on the way) and streams the rendered
+PDF from memory into GridFS. No extraction or generation is run; only the
+I/O is measured.
+
+Runs against mongomock by default (whose in-process store is excluded by
+measuring from a baseline taken after populating it). Set BENCH_MONGODB_URL
+to use a real (throwaway) MongoDB instead. RSS is sampled from /proc, so
+this needs Linux.
+
+    python benchmarks/bench_requestMemory.py [--files 8] [--mb 16]
+"""
+import argparse
+import gc
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from gridfsStream import spool_to_path, put_stream  # noqa: E402
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+class PeakRss:
+    """Samples RSS in a thread while the block runs; .peak is above the start."""
+
+    def __enter__(self):
+        gc.collect()
+        self.start = rss()
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss() - self.start)
+            time.sleep(0.001)
+
+    def __exit__(self, *exc):
+        self.peak = max(self.peak, rss() - self.start)
+        self._stop.set()
+        self._thread.join()
+
+
+def getFs():
+    import gridfs
+    url = os.environ.get("BENCH_MONGODB_URL")
+    if url:
+        from pymongo import MongoClient
+        return gridfs.GridFS(MongoClient(url)["studyAssistBench"], collection="uploads"), "mongodb"
+
+    import mongomock
+    import mongomock.gridfs
+    mongomock.gridfs.enable_gridfs_integration()
+    return gridfs.GridFS(mongomock.MongoClient()["studyAssistBench"], collection="uploads"), "mongomock"
+
+
+def populate(fs, files: int, mb: float) -> list:
+    block = os.urandom(1024 * 1024)
+    ids = []
+    for i in range(files):
+        payload = block * int(mb) + block[: int((mb % 1) * len(block))]
+        ids.append(fs.put(payload, filename=f"notes{i}.pdf", content_type="application/pdf"))
+        del payload
+    return ids
+
+
+def before(fs, ids, result: bytes):
+    contents = [fs.get(file_id).read() for file_id in ids]        # held for the whole request
+    for content in contents:
+        hashlib.sha256(content).hexdigest()
+
+    with tempfile.TemporaryDirectory() as genResults:
+        path = os.path.join(genResults, "studyGuide_content.pdf")
+        with open(path, "wb") as f:
+            f.write(result)
+        with open(path, "rb") as f:
+            return fs.put(f, filename="studyGuide_content.pdf", content_type="application/pdf")
+
+
+def after(fs, ids, result: bytes):
+    for file_id in ids:
+        with spool_to_path(fs, file_id, suffix=".pdf"):
+            pass
+    return put_stream(fs, BytesIO(result), filename="studyGuide_content.pdf",
+                      content_type="application/pdf")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--mb", type=float, default=16.0, help="size of each upload")
+    parser.add_argument("--result-mb", type=float, default=1.0, help="size of the rendered PDF")
+    args = parser.parse_args()
+
+    fs, backend = getFs()
+    ids = populate(fs, args.files, args.mb)
+    result = os.urandom(int(args.result_mb * 1024 * 1024))
+    print(f"Backend: {backend}, {args.files} uploads x {args.mb:g} MB")
+
+    for name, fn in (("before", before), ("after", after)):
+        with PeakRss() as peak:
+            start = time.perf_counter()
+            fn(fs, ids, result)
+            elapsed = time.perf_counter() - start
+        print(f"{name:>6}: peak +{peak.peak / 2**20:8.1f} MB RSS  {elapsed:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Generation cost per generation type as uploads grow: chunked mode (one
+prompt per context chunk) vs. retrieval mode (one prompt of the top BM25
+passages, see retrieval.PassageIndex).
+
+Counts prompts (= model.generate calls) and prompt tokens; the index build
+and passage selection are timed. No model is run, only the tokenizer.
+
+The types' questions differ in length, and every type chunks with the
+longest one's question_reserve, as /generate does. The run fails if a
+type's retrieved context does not fit a single prompt.
+
+    python benchmarks/bench_retrieval.py [--types 4]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import llmUtils  # noqa: E402
+from tokenDoc import TokenizedText  # noqa: E402
+
+CONTEXT_TOKENS = [2_000, 20_000, 100_000, 400_000]
+HEADER = "Your task is to generate study content from the files below.\n\n"
+TYPES = ["studyGuide", "flashcards", "practiceTest", "keyTerms"]
+# per-type instructions, so the questions (and their reserve) differ in length
+INSTRUCTIONS = {
+    "studyGuide":   "",
+    "flashcards":   "One term per card.",
+    "practiceTest": "Mix multiple choice, short answer and essay questions. " * 12,
+    "keyTerms":     "Define each term in one sentence. " * 40,
+}
+
+TOPICS = [
+    "Photosynthesis converts light energy into chemical energy in the chloroplast.",
+    "The French Revolution began in 1789 with the storming of the Bastille.",
+    "Covalent bonds share electrons while ionic bonds transfer them between atoms.",
+    "Supply and demand curves meet at the market equilibrium price.",
+    "Newton's second law states that force equals mass times acceleration.",
+]
+
+
+def buildContext(tokens: int) -> str:
+    rng = random.Random(tokens)
+    sentenceTokens = len(llmUtils.generator.tokenizer.encode(TOPICS[0]))
+    return " ".join(rng.choice(TOPICS) for _ in range(tokens // sentenceTokens))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--types", type=int, default=4, help="generation types per request")
+    args = parser.parse_args()
+
+    print(f"{'context tok':>12} {'chunked prompts':>16} {'chunked tok':>12} "
+          f"{'retrieval prompts':>18} {'retrieval tok':>14} {'index s':>8} {'select ms':>10}")
+    for size in CONTEXT_TOKENS:
+        doc = TokenizedText(buildContext(size))
+        doc.ids(llmUtils.generator.tokenizer)          # tokenising is shared by both modes
+
+        chunkedPrompts = chunkedTokens = retrievalPrompts = retrievalTokens = 0
+        start = time.perf_counter()
+        index = llmUtils.build_passage_index(doc)
+        indexSeconds = time.perf_counter() - start
+
+        selectSeconds = 0.0
+        queries = {generation: f"Generate the {generation}. {INSTRUCTIONS[generation]}"
+                   for generation in TYPES[:args.types]}
+        reserve = max(llmUtils.question_tokens(query) for query in queries.values())
+        for generation, query in queries.items():
+            parts = llmUtils.chunk_prompt_parts(doc, query, header=HEADER, question_reserve=reserve)
+            chunkedPrompts += len(parts)
+            chunkedTokens += sum(len(h) + len(c) + len(q) for h, c, q in parts)
+
+            start = time.perf_counter()
+            selected = llmUtils.retrieve_context(index, query, search=f"{generation} Bastille revolution",
+                                                 header=HEADER, question_reserve=reserve)
+            selectSeconds += time.perf_counter() - start
+            parts = llmUtils.chunk_prompt_parts(selected, query, header=HEADER, question_reserve=reserve)
+            assert len(parts) == 1, f"{generation}: retrieved context split into {len(parts)} prompts"
+            retrievalPrompts += len(parts)
+            retrievalTokens += sum(len(h) + len(c) + len(q) for h, c, q in parts)
+
+        print(f"{doc.count(llmUtils.generator.tokenizer):>12} {chunkedPrompts:>16} {chunkedTokens:>12} "
+              f"{retrievalPrompts:>18} {retrievalTokens:>14} {indexSeconds:>8.2f} "
+              f"{selectSeconds / args.types * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Tokenisation time per request on a multi-MB context, before and after
+prompts were assembled from memoised ids (tokenDoc.TokenizedText).
+
+"before" replays the tokenizer calls one request used to make: every
+generation type re-tokenised the context, chunk prompts were decoded to
+text and re-tokenised by generate, and compression tokenised the context
+with both tokenizers plus the joined summaries. "after" runs the current
+llmUtils helpers. Only tokenisation is timed; no model is run.
+
+    python benchmarks/bench_tokenisation.py [--mb 4] [--types 4]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import llmUtils  # noqa: E402
+from tokenDoc import TokenizedText  # noqa: E402
+
+QUERY = "Generate a study guide covering every key term with a short definition."
+
+PARAGRAPH = (
+    "The Krebs cycle oxidises acetyl-CoA to carbon dioxide, producing NADH and FADH2 "
+    "that feed the electron transport chain. ATP synthase uses the proton gradient "
+    "across the inner mitochondrial membrane to phosphorylate ADP. "
+)
+
+
+def before(context: str, types: int):
+    gen = llmUtils.generator.tokenizer
+    summ = llmUtils.summarizer.tokenizer
+
+    # compression check: generator count, summariser slices, joined-summary count
+    gen(context)["input_ids"]
+    summ(context)["input_ids"]
+    gen(context[: len(context) // 10])["input_ids"]
+
+    for _ in range(types):
+        query_ids = gen.encode(f"\n\nQuestion: {QUERY}\nAnswer:", add_special_tokens=False)
+        context_ids = gen.encode(context, add_special_tokens=False)
+        step = 2048 - len(query_ids) - 600 - 1
+        for i in range(0, len(context_ids), step):
+            prompt = gen.decode(context_ids[i:i + step] + query_ids, skip_special_tokens=True,
+                                clean_up_tokenization_spaces=True)
+            gen(prompt, return_tensors="pt")       # generate_with_progress re-tokenised it
+
+
+def after(context: str, types: int):
+    doc = TokenizedText(context)
+    doc.count(llmUtils.generator.tokenizer)
+    doc.ids(llmUtils.summarizer.tokenizer)
+
+    for _ in range(types):
+        llmUtils.chunk_prompt_ids(doc, QUERY)
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, default=4.0)
+    parser.add_argument("--types", type=int, default=4, help="generation types per request")
+    args = parser.parse_args()
+
+    context = PARAGRAPH * int(args.mb * 1024 * 1024 / len(PARAGRAPH))
+    print(f"Context: {len(context) / 1e6:.1f} MB, {args.types} generation types")
+
+    t_before = timed(before, context, args.types)
+    t_after = timed(after, context, args.types)
+    print(f"before: {t_before:8.2f} s")
+    print(f"after:  {t_after:8.2f} s  ({t_before / t_after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
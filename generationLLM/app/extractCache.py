@@ -0,0 +1,122 @@
+import os
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock, get_ident
+from typing import Dict, Optional
+
+from metrics import HitCounter
+
+CACHE_ROOT      = Path(__file__).resolve().parent / ".cache"
+CACHE_DIR       = Path(os.environ.get("EXTRACT_CACHE_DIR", CACHE_ROOT / "extracted"))
+CACHE_MAX_BYTES = int(os.environ.get("EXTRACT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def digest_key(digest: str, content_type: str, version: int) -> str:
+    """
+    Content address for one extraction: the file's sha256 hex digest
+    (computed while streaming it), how its bytes are interpreted and which
+    extractor version produced the text.
+    """
+    return hashlib.sha256(f"{digest}|{content_type}|v{version}".encode()).hexdigest()
+
+
+class ExtractCache:
+    """
+    On-disk store of extracted text with size-based LRU eviction.
+
+    One UTF-8 file per key. Recency is kept in memory and mirrored into the
+    file mtimes, so a restarted process rebuilds the same LRU order.
+
+    Several workers may share the directory, so the disk is the source of
+    truth: a key missing from this process' index is still served if another
+    worker wrote its file, and the byte budget is enforced over a fresh scan
+    of the directory rather than this process' own writes.
+    """
+
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.counter = HitCounter()
+        self._lock = Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()   # key -> size, oldest first
+        self._bytes = 0
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._rescan()
+
+    def _rescan(self):
+        """Rebuild the index from the directory, oldest mtime first. Call with the lock held."""
+        found = []
+        for path in self.root.glob("*.txt"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:    # evicted by another worker meanwhile
+                continue
+            found.append((stat.st_mtime, path.stem, stat.st_size))
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(found))
+        self._bytes = sum(self._entries.values())
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.txt"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        with self._lock:
+            if key not in self._entries:
+                try:
+                    # written by another worker sharing the directory
+                    self._entries[key] = path.stat().st_size
+                    self._bytes += self._entries[key]
+                except FileNotFoundError:
+                    self.counter.record(False)
+                    return None
+            self._entries.move_to_end(key)
+
+        try:
+            text = path.read_text(encoding="utf-8")
+            os.utime(path)
+        except FileNotFoundError:        # evicted or removed behind our back
+            with self._lock:
+                self._bytes -= self._entries.pop(key, 0)
+            self.counter.record(False)
+            return None
+        self.counter.record(True)
+        return text
+
+    def put(self, key: str, text: str):
+        data = text.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}-{get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            # other workers' files count against the same budget
+            self._rescan()
+            while self._bytes > self.max_bytes and self._entries:
+                old_key, size = self._entries.popitem(last=False)
+                self._bytes -= size
+                self._path(old_key).unlink(missing_ok=True)
+
+    def clear(self):
+        """Delete every entry and reset the hit counters."""
+        with self._lock:
+            for path in self.root.glob("*.txt"):
+                path.unlink(missing_ok=True)
+            self._entries.clear()
+            self._bytes = 0
+        self.counter.reset()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.counter.stats(),
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+            }
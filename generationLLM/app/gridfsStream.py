@@ -0,0 +1,61 @@
+import os
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from io import BytesIO
+from typing import BinaryIO, Iterator, Tuple, Union
+
+from bson import ObjectId
+
+from metrics import span
+
+READ_CHUNK = 255 * 1024                            # GridFS's default chunk size
+SPOOL_DIR  = os.environ.get("GRIDFS_SPOOL_DIR")    # None -> system temp dir
+# Payload kept in a plain Mongo document, short of its 16 MB cap; anything
+# larger belongs in GridFS or is not stored
+DOCUMENT_MAX_BYTES = 12 * 1024 * 1024
+
+
+def iter_chunks(fs, file_id: Union[str, ObjectId], chunk_size: int = READ_CHUNK) -> Iterator[bytes]:
+    """Yield a stored file's bytes `chunk_size` at a time."""
+    grid_out = fs.get(ObjectId(file_id))
+    try:
+        while True:
+            chunk = grid_out.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        grid_out.close()
+
+
+@contextmanager
+def spool_to_path(fs, file_id: Union[str, ObjectId], suffix: str = "") -> Iterator[Tuple[str, str]]:
+    """
+    Copy a GridFS file chunk-wise into a temp file and yield (path, sha256).
+
+    The digest is computed on the same pass, so the content hash never
+    needs the whole file in memory. The temp file is removed on exit.
+    """
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=SPOOL_DIR)
+    try:
+        with span("gridfs_read"), os.fdopen(fd, "wb") as out:
+            for chunk in iter_chunks(fs, file_id):
+                digest.update(chunk)
+                out.write(chunk)
+        yield path, digest.hexdigest()
+    finally:
+        os.remove(path)
+
+
+def put_stream(fs, data: Union[bytes, BinaryIO], **metadata) -> ObjectId:
+    """Store bytes or a readable buffer in GridFS, written one chunk at a time."""
+    source = BytesIO(data) if isinstance(data, bytes) else data
+    with span("gridfs_upload"), fs.new_file(**metadata) as grid_in:
+        while True:
+            chunk = source.read(READ_CHUNK)
+            if not chunk:
+                break
+            grid_in.write(chunk)
+    return grid_in._id
@@ -0,0 +1,88 @@
+import os
+import time
+import uuid
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Dict, Optional
+
+MAX_WORKERS = int(os.environ.get("GENERATION_WORKERS", "2"))
+MAX_PENDING = int(os.environ.get("GENERATION_MAX_PENDING", "16"))
+FINISHED_JOB_TTL = 60 * 60  # seconds a finished job stays queryable
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds its maximum number of jobs."""
+
+
+class JobCancelled(Exception):
+    """Raised by a job that stopped early on request; recorded as "cancelled"."""
+
+
+class JobQueue:
+    """
+    Bounded worker pool for generation jobs.
+
+    Jobs run on worker threads so the blocking GridFS reads, extraction and
+    model calls never touch the event loop. At most `max_workers` jobs run
+    at once and at most `max_pending` more wait for a free worker; anything
+    beyond that is rejected with QueueFullError.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, max_pending: int = MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="generate")
+        self._slots = BoundedSemaphore(max_workers + max_pending)
+        self._lock = Lock()
+        self._jobs: Dict[str, Dict] = {}
+
+    def submit(self, fn: Callable[..., None], *args, **kwargs) -> str:
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Too many generation jobs queued")
+
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = {"jobId": job_id, "status": "queued",
+                                  "submittedAt": time.time()}
+        try:
+            self._executor.submit(self._run, job_id, fn, args, kwargs)
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                del self._jobs[job_id]
+            raise
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable[..., None], args, kwargs):
+        self._update(job_id, status="running", startedAt=time.time())
+        try:
+            fn(job_id, *args, **kwargs)
+            self._update(job_id, status="done", finishedAt=time.time())
+        except JobCancelled as e:
+            print(f"⏹️  Job {job_id} cancelled: {e}")
+            self._update(job_id, status="cancelled", finishedAt=time.time())
+        except Exception as e:
+            print(f"❌ Job {job_id} failed: {e}")
+            traceback.print_exc()
+            self._update(job_id, status="failed", error=str(e), finishedAt=time.time())
+        finally:
+            self._slots.release()
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _prune(self):
+        cutoff = time.time() - FINISHED_JOB_TTL
+        for job_id in [k for k, job in self._jobs.items()
+                       if job.get("finishedAt", cutoff + 1) < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
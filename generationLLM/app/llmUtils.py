@@ -1,17 +1,23 @@
-import pdfplumber
 from fpdf import FPDF
 
 import torch
 
-import pytesseract
-from PIL import Image
-import speech_recognition as sr
-
+import os
 import threading
-from transformers import TextIteratorStreamer
-from contextlib import suppress
-
-from modelCache import load_pipeline
+import time
+from queue import Queue
+from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
+from contextlib import suppress, contextmanager
+
+from modelCache import lazy_pipeline
+from summaryEngine import SUMMARISER_ID, summarise_slices
+from pdfExtract import iter_pdf_pages
+from ocr import extract_image_text
+from transcribe import iter_transcript
+from tokenDoc import TokenizedText, as_doc
+from prefixCache import PrefixCache, stack_caches, PREFIX_CACHE_ENABLED
+from metrics import span, record_generation
+from retrieval import PassageIndex
 
 try:
     from tqdm import tqdm          # nice progress bars
@@ -28,131 +34,288 @@ def progress_iter(it, desc):
         print(desc + " …")
         return it                  # plain iterator (no bar)
 
-summarizer = load_pipeline("summarization",
-        "sshleifer/distilbart-cnn-6-6",
+# Handles load on first use (or in warm_up), so importing this module is cheap
+summarizer = lazy_pipeline("summarization",
+        SUMMARISER_ID,
     )
 
-generator  = load_pipeline("text-generation",
+generator  = lazy_pipeline("text-generation",
         #"tiiuae/falcon-rw-1b", #default
         "EleutherAI/gpt-neo-125M",   # testing
     )
 
 from io import BytesIO
 
+# Bump whenever an extractor changes its output so cached text is not reused
+EXTRACTOR_VERSION = 4
+
 def extract_text_from_pdf(file_path: str) -> str:
-    with pdfplumber.open(BytesIO(file_path)) as pdf:
-        pages = progress_iter(pdf.pages, desc="📄 Extracting PDF pages")
-        return "\n".join(p.extract_text() or "" for p in pages)
+    """Page-streamed PDF text (see pdfExtract.iter_pdf_pages for the caps)."""
+    pages = progress_iter(iter_pdf_pages(file_path), desc="📄 Extracting PDF pages")
+    return "\n".join(pages)
 
 def extract_text_from_image(file_path: str) -> str:
-    """Extract text from an image using OCR."""
-    img = Image.open(file_path)
-    return pytesseract.image_to_string(img)
+    """Extract text from an image (every frame of a multi-page one) using OCR."""
+    return extract_image_text(file_path)
 
 def extract_text_from_audio(file_path: str) -> str:
-    """Transcribe speech from an audio file."""
-    recognizer = sr.Recognizer()
-    with sr.AudioFile(file_path) as source:
-        audio = recognizer.record(source)
-    # type: ignore is used to suppress IDE type checking errors for recognize_google
-    return recognizer.recognize_google(audio)  # type: ignore
+    """Transcribe speech offline, segment by segment (see transcribe.iter_transcript)."""
+    segments = progress_iter(iter_transcript(file_path), desc="🎙️ Transcribing audio segments")
+    return "\n".join(segments)
 
 def extract_text_by_type(file_path: str, content_type: str) -> str:
     """Smart dispatcher that chooses the correct extractor based on MIME type."""
     if content_type == "application/pdf":
-        return extract_text_from_pdf(file_path)
+        with span("extract_pdf"):
+            return extract_text_from_pdf(file_path)
     elif content_type.startswith("image/"):
-        return extract_text_from_image(file_path)
+        with span("extract_image"):
+            return extract_text_from_image(file_path)
     elif content_type.startswith("audio/"):
-        return extract_text_from_audio(file_path)
+        with span("extract_audio"):
+            return extract_text_from_audio(file_path)
     else:
         raise ValueError(f"Unsupported content type: {content_type}")
 
 
-GENERATOR_LIMIT   = generator.model.config.max_position_embeddings   # 2048
 SAFETY_MARGIN     = 150       # reserve tokens for the answer itself
-MAX_INPUT_TOKENS  = GENERATOR_LIMIT - SAFETY_MARGIN                 # 1898
 SUMMARISE_CHUNK   = 800       # slice for distilBART
 PARTIAL_SUM_TOK   = 200       # each partial summary target length
+GENERATION_BATCH  = int(os.environ.get("GENERATION_BATCH_SIZE", "4"))  # chunks per generate call
+QUESTION_RESERVE  = 256       # question tokens reserved per chunk, so chunk
+                              # boundaries match across generation types
+STREAM_QUEUE_TOKENS = 32      # decoded pieces buffered ahead of a slow consumer
+ANSWER_SEPARATOR  = "\n\n---\n\n"  # between chunk answers
+GENERATE_CONCURRENCY = int(os.environ.get("GENERATE_CONCURRENCY", "2"))  # model.generate calls at once, process-wide
+# split the cores between concurrent generate calls instead of letting each
+# one start a full intra-op pool
+TORCH_THREADS     = int(os.environ.get("TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // GENERATE_CONCURRENCY))))
+
+# past key values of shared prompt prefixes (header, header + chunk)
+prefix_cache = PrefixCache(lambda: generator.model)
+
+torch.set_num_threads(TORCH_THREADS)
+_generate_slots = threading.BoundedSemaphore(GENERATE_CONCURRENCY)
+
+
+@contextmanager
+def generate_slot():
+    """Hold one of the GENERATE_CONCURRENCY slots for a model.generate call or prefill pass."""
+    with span("generate_wait"):
+        _generate_slots.acquire()
+    try:
+        yield
+    finally:
+        _generate_slots.release()
+
+
+def warm_up():
+    """Load both pipelines now instead of on the first request."""
+    for handle in (generator, summarizer):
+        handle.get()
+
+
+def models_ready() -> bool:
+    return generator.loaded and summarizer.loaded
+
+
+def max_input_tokens() -> int:
+    """Context tokens that fit the generator next to SAFETY_MARGIN answer tokens."""
+    return generator.model.config.max_position_embeddings - SAFETY_MARGIN   # 1898
 
 
 # ---------------------------------------------------------------------
 #  Helper: compress if needed
 # ---------------------------------------------------------------------
-from typing import List
+from typing import Callable, List, Optional, Tuple, Union
+
+# on_progress(stage, done, total) - lets callers publish pipeline progress
+ProgressCallback = Callable[[str, int, int], None]
+
+# prompts travel as generator token ids; plain text is still accepted
+PromptLike = Union[str, List[int]]
 
-def _compress_if_needed(text: str) -> str:
+def _prompt_ids(prompt: PromptLike) -> List[int]:
+    if isinstance(prompt, str):
+        return generator.tokenizer(prompt)["input_ids"]
+    return prompt
+
+def _compress_if_needed(text: Union[str, TokenizedText],
+                        on_progress: Optional[ProgressCallback] = None) -> TokenizedText:
+    doc      = as_doc(text)
     tok      = generator.tokenizer
-    total_tk = len(tok(text)["input_ids"])
-    if total_tk <= MAX_INPUT_TOKENS:
+    total_tk = doc.count(tok)
+    if total_tk <= max_input_tokens():
         print(f"✅ Context fits ({total_tk} tokens), no compression.")
-        return text
+        return doc
 
     print(f"🔻 Compressing {total_tk} tokens → summaries …")
 
-    # slice & summarise with progress bar
-    ids = summarizer.tokenizer(text)["input_ids"]
+    # slice & summarise the ids directly – no decode / re-tokenise round trip
+    ids = doc.ids(summarizer.tokenizer)
     chunks = [ids[i : i + SUMMARISE_CHUNK]
               for i in range(0, len(ids), SUMMARISE_CHUNK)]
 
-    partials: list[str] = []
-    for idx_ids in progress_iter(range(len(chunks)), desc="✂️  Summarising"):
-        decoded = summarizer.tokenizer.decode(
-            chunks[idx_ids], skip_special_tokens=True,
-            clean_up_tokenization_spaces=True
-        )
-        part = summarizer(decoded, max_length=PARTIAL_SUM_TOK,
-                          min_length=60, do_sample=False)[0]["summary_text"]
-        partials.append(part)
+    bar = tqdm(total=len(chunks), desc="✂️  Summarising") if tqdm else None
+
+    def _on_summarised(done: int, total: int):
+        if bar:
+            bar.n = done
+            bar.refresh()
+        if on_progress:
+            on_progress("compress", done, total)
+
+    with span("compress"):
+        partials = summarise_slices(chunks,
+                                    model=summarizer.model,
+                                    tokenizer=summarizer.tokenizer,
+                                    on_progress=_on_summarised,
+                                    max_length=PARTIAL_SUM_TOK,
+                                    min_length=60,
+                                    do_sample=False)
+    if bar:
+        bar.close()
 
-    comp_len = len(tok(" ".join(partials))["input_ids"])
-    print(f"✅ Compressed to {comp_len} tokens.")
-    return " ".join(partials)
+    # the count is memoised on the returned doc, so prompt assembly reuses it
+    compressed = TokenizedText(" ".join(partials))
+    print(f"✅ Compressed to {compressed.count(tok)} tokens.")
+    return compressed
 
-def get_token_budget(prompt: str, desired_output: int = 500):
-    input_ids = generator.tokenizer(prompt, return_tensors="pt")["input_ids"]
-    prompt_len = input_ids.shape[1]
+def get_token_budget(prompt: PromptLike, desired_output: int = 500):
+    prompt_len = len(_prompt_ids(prompt))
     model_limit = generator.model.config.max_position_embeddings
 
     budget = model_limit - prompt_len - 1
     return min(desired_output, max(budget, 50))  # never generate fewer than 50
 
 
-def chunk_prompt_for_generation(context: str, query: str, max_tokens: int = 2048, generation_tokens: int = 600) -> List[str]:
+def chunk_prompt_parts(context: Union[str, TokenizedText], query: str, max_tokens: int = 2048,
+                       generation_tokens: int = 600,
+                       header: str = "",
+                       question_reserve: int = 0) -> List[Tuple[List[int], List[int], List[int]]]:
     """
-    Splits context + query into chunks that leave room for generation.
+    Splits header + context + query into (header, chunk, question) id parts
+    that leave room for generation.
+
+    The shared parts come first so their past key values can be reused:
+    the header across every chunk, header + chunk across every generation
+    type. Chunk size only depends on the question when it is longer than
+    both QUESTION_RESERVE and `question_reserve`; callers asking several
+    questions of one context pass the longest one's question_tokens() so
+    every question gets identical chunks.
+    A TokenizedText context is only tokenised once however often it is chunked.
     """
     tokenizer = generator.tokenizer
-    query_ids = tokenizer.encode(f"\n\nQuestion: {query}\nAnswer:", add_special_tokens=False)
-    context_ids = tokenizer.encode(context, add_special_tokens=False)
+    header_ids, query_ids, max_context_tokens = _prompt_frame(query, max_tokens, generation_tokens, header,
+                                                              question_reserve)
+    context_ids = as_doc(context).ids(tokenizer)
+
+    return [(header_ids, context_ids[i:i + max_context_tokens], query_ids)
+            for i in range(0, len(context_ids), max_context_tokens)]
+
+
+def _question_ids(query: str) -> List[int]:
+    return generator.tokenizer.encode(f"\n\nQuestion: {query}\nAnswer:", add_special_tokens=False)
+
+
+def question_tokens(query: str) -> int:
+    """Prompt tokens `query` takes after the context, for chunk_prompt_parts' question_reserve."""
+    return len(_question_ids(query))
+
+
+def _prompt_frame(query: str, max_tokens: int, generation_tokens: int,
+                  header: str, question_reserve: int = 0) -> Tuple[List[int], List[int], int]:
+    """Header ids, question ids and the context tokens left for one chunk."""
+    tokenizer = generator.tokenizer
+    header_ids = tokenizer.encode(header, add_special_tokens=False) if header else []
+    query_ids = _question_ids(query)
 
-    # Leave room for query and generation
-    max_context_tokens = max_tokens - len(query_ids) - generation_tokens - 1
+    # Leave room for header, query and generation
+    reserve = max(len(query_ids), question_reserve, QUESTION_RESERVE)
+    max_context_tokens = max_tokens - len(header_ids) - reserve - generation_tokens - 1
 
     if max_context_tokens <= 0:
         raise ValueError("Query + generation budget too large for model.")
+    return header_ids, query_ids, max_context_tokens
+
+
+def build_passage_index(context: Union[str, TokenizedText]) -> PassageIndex:
+    """BM25 index over the context's passages, for retrieve_context."""
+    with span("retrieval_index"):
+        return PassageIndex(as_doc(context), generator.tokenizer)
+
+
+def retrieve_context(index: PassageIndex, query: str, search: str, max_tokens: int = 2048,
+                     generation_tokens: int = 600, header: str = "",
+                     question_reserve: int = 0) -> TokenizedText:
+    """
+    The passages most relevant to `search` that fit a single prompt for
+    `query`, so chunked_query_answer makes one generate call however
+    large the uploads are. Pass chunked_query_answer the same
+    `question_reserve`, or the selection may not fit one chunk.
+    """
+    _, _, budget = _prompt_frame(query, max_tokens, generation_tokens, header, question_reserve)
+    with span("retrieval_select"):
+        selected = index.select(search, budget)
+    print(f"🔎 Selected {selected.count(generator.tokenizer)} of "
+          f"{index.doc.count(generator.tokenizer)} context tokens")
+    return selected
+
+
+def chunk_prompt_ids(context: Union[str, TokenizedText], query: str, max_tokens: int = 2048,
+                     generation_tokens: int = 600, header: str = "") -> List[List[int]]:
+    """
+    Splits context + query into prompt id lists that leave room for generation.
+    """
+    return [h + c + q for h, c, q in
+            chunk_prompt_parts(context, query, max_tokens, generation_tokens, header)]
 
-    chunks = [context_ids[i:i + max_context_tokens]
-              for i in range(0, len(context_ids), max_context_tokens)]
 
-    return [tokenizer.decode(chunk + query_ids, skip_special_tokens=True,
+def chunk_prompt_for_generation(context: str, query: str, max_tokens: int = 2048, generation_tokens: int = 600) -> List[str]:
+    """
+    Splits context + query into chunks that leave room for generation.
+    """
+    tokenizer = generator.tokenizer
+    return [tokenizer.decode(ids, skip_special_tokens=True,
                              clean_up_tokenization_spaces=True)
-            for chunk in chunks]
+            for ids in chunk_prompt_ids(context, query, max_tokens, generation_tokens)]
+
+
 
 
+class _StopWhenSet(StoppingCriteria):
+    """Ends generation at the next step once `event` is set."""
 
+    def __init__(self, event: threading.Event):
+        self.event = event
 
-def generate_with_progress(prompt: str,
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(),
+                          dtype=torch.bool, device=input_ids.device)
+
+
+def generate_with_progress(prompt: PromptLike,
                            *,
                            max_new_tokens: int = 350,
+                           on_token: Optional[Callable[[str], None]] = None,
+                           cancel: Optional[threading.Event] = None,
                            **gen_kwargs) -> str:
+    """
+    Generate one answer, streaming it token by token.
+
+    `on_token` receives each piece of text as it is decoded; it may block,
+    and generation waits for it (the streamer's queue is bounded) while
+    holding a generate slot, so it must not block indefinitely (see
+    tokenStream.TokenStream). Setting `cancel` stops model.generate at the
+    next step.
+    """
     tokenizer = generator.tokenizer
     model = generator.model
     device = generator.device
 
-    # Tokenize and move to correct device
-    prompt_ids = tokenizer(prompt, return_tensors="pt")
-    prompt_ids = {k: v.to(device) for k, v in prompt_ids.items()}
+    # Tokenize (unless given ids) and move to correct device
+    input_ids = torch.tensor([_prompt_ids(prompt)], dtype=torch.long, device=device)
+    prompt_ids = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
 
     prompt_token_len = prompt_ids["input_ids"].shape[1]
     model_limit = model.config.max_position_embeddings  # 2048 for GPT-Neo
@@ -173,33 +336,117 @@ def generate_with_progress(prompt: str,
         skip_prompt=True,
         skip_special_tokens=True,
     )
+    # bounded, so a slow on_token holds generate back instead of buffering
+    streamer.text_queue = Queue(maxsize=STREAM_QUEUE_TOKENS)
+    # `abort` stops the worker if consuming the stream fails, so it never
+    # blocks on the bounded queue while holding a generate slot
+    abort = threading.Event()
+    stops = [_StopWhenSet(abort)] + ([_StopWhenSet(cancel)] if cancel is not None else [])
+    gen_kwargs["stopping_criteria"] = StoppingCriteriaList(stops)
+
+    output = {}
 
     def _worker():
-        model.generate(
-            **prompt_ids,
-            streamer=streamer,
-            max_new_tokens=capped_gen_tokens,
-            **gen_kwargs,
-        )
+        try:
+            output["ids"] = model.generate(
+                **prompt_ids,
+                streamer=streamer,
+                max_new_tokens=capped_gen_tokens,
+                **gen_kwargs,
+            )
+        except BaseException as e:
+            output["error"] = e
+        finally:
+            streamer.end()          # always unblock the consumer loop
+
+    with generate_slot(), span("generate"):
+        started = time.perf_counter()
+        thread = threading.Thread(target=_worker)
+        thread.start()
+
+        bar = tqdm(total=capped_gen_tokens, desc="📝 Generating", leave=False) if tqdm else None
+        tokens = []
+        try:
+            for token in streamer:
+                tokens.append(token)
+                if on_token and not (cancel is not None and cancel.is_set()):
+                    on_token(token)
+                if bar:
+                    bar.update(1)
+        except BaseException:
+            abort.set()
+            for _ in streamer:      # drain until the worker has stopped
+                pass
+            raise
+        finally:
+            if bar:
+                bar.close()
+            thread.join()
+        if "error" in output:
+            raise output["error"]
+    seconds = time.perf_counter() - started
+    if "ids" in output:
+        record_generation(prompt_token_len, output["ids"].shape[1] - prompt_token_len, seconds)
+    return "".join(tokens).strip()
 
-    thread = threading.Thread(target=_worker)
-    thread.start()
 
-    bar = tqdm(total=capped_gen_tokens, desc="📝 Generating", leave=False) if tqdm else None
-    tokens = []
-    for token in streamer:
-        tokens.append(token)
-        if bar:
-            bar.update(1)
-    if bar:
-        bar.close()
 
-    thread.join()
-    return "".join(tokens).strip()
+def generate_batch(prompts: List[PromptLike],
+                   *,
+                   max_new_tokens: int = 350,
+                   batch_size: int = GENERATION_BATCH,
+                   **gen_kwargs) -> List[str]:
+    """
+    Generate answers for several prompts at once.
+
+    Prompts are left-padded into micro-batches of `batch_size` so each
+    model.generate call does one forward pass per step for the whole batch.
+    """
+    tokenizer = generator.tokenizer
+    model = generator.model
+    device = generator.device
+    model_limit = model.config.max_position_embeddings
+
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    answers: List[str] = []
+    for start in range(0, len(prompts), batch_size):
+        batch = tokenizer.pad({"input_ids": [_prompt_ids(p) for p in prompts[start:start + batch_size]]},
+                              return_tensors="pt", padding=True, padding_side="left")
+        batch = {k: v.to(device) for k, v in batch.items()}
+
+        prompt_token_len = batch["input_ids"].shape[1]
+        max_allowed_tokens = model_limit - prompt_token_len
+        if max_allowed_tokens <= 0:
+            raise ValueError(f"🚫 Prompt too long: {prompt_token_len} tokens")
+        capped_gen_tokens = min(max_new_tokens, max_allowed_tokens - 1)
 
+        started = time.perf_counter()
+        with generate_slot(), torch.inference_mode(), span("generate"):
+            out_ids = model.generate(
+                **batch,
+                max_new_tokens=capped_gen_tokens,
+                pad_token_id=tokenizer.pad_token_id,
+                **gen_kwargs,
+            )
+        # finished rows are padded up to the longest answer
+        record_generation(int(batch["attention_mask"].sum()),
+                          int((out_ids[:, prompt_token_len:] != tokenizer.pad_token_id).sum()),
+                          time.perf_counter() - started)
+
+        # left padding keeps every prompt the same width, so the answers
+        # all start at the same column
+        answers.extend(
+            text.strip() for text in tokenizer.batch_decode(
+                out_ids[:, prompt_token_len:], skip_special_tokens=True)
+        )
 
+    return answers
 
-def single_query_answer(query: str, context: str) -> str:
+
+def single_query_answer(query: str, context: Union[str, TokenizedText],
+                        on_progress: Optional[ProgressCallback] = None) -> str:
     """
     • `document_text`  - full extracted PDF / OCR text
     • `system_prompt`  - your preset context + question, e.g.
@@ -207,34 +454,111 @@ def single_query_answer(query: str, context: str) -> str:
 
     Returns the model's single, well-developed answer.
     """
-    context = _compress_if_needed(context)        # compress iff too long
-    full_prompt = f"{context}\n\nQuestion: {query}\nAnswer:"
+    context = _compress_if_needed(context, on_progress)  # compress iff too long
+    tokenizer = generator.tokenizer
+    full_prompt = context.ids(tokenizer) + tokenizer.encode(
+        f"\n\nQuestion: {query}\nAnswer:", add_special_tokens=False)
     print("🤖 Generating final answer … (may take a moment)")
     
     
     MODEL_LIMIT = generator.model.config.max_position_embeddings   # 2048
-    prompt_tokens   = len(generator.tokenizer(full_prompt)["input_ids"])
+    prompt_tokens   = len(full_prompt)
     budget = MODEL_LIMIT - prompt_tokens
     max_answer = max(budget - 20, 50)  # never let it go below 50
+    if on_progress:
+        on_progress("generate", 0, 1)
     response = generate_with_progress(full_prompt, max_new_tokens=max_answer, do_sample=False, no_repeat_ngram_size=3)
+    if on_progress:
+        on_progress("generate", 1, 1)
     print("✅ Answer generated.")
     # strip the prompt portion to keep only the generated answer
     return response
 
-def chunked_query_answer(query: str, context: str, max_new_tokens: int = 600) -> str:
+def chunked_query_answer(query: str, context: Union[str, TokenizedText], max_new_tokens: int = 600,
+                         on_progress: Optional[ProgressCallback] = None,
+                         batch_size: int = GENERATION_BATCH,
+                         stream: bool = False,
+                         header: str = "",
+                         use_prefix_cache: bool = PREFIX_CACHE_ENABLED,
+                         on_token: Optional[Callable[[str], None]] = None,
+                         cancel: Optional[threading.Event] = None,
+                         question_reserve: int = 0,
+                         on_error: Optional[Callable[[str, Exception], None]] = None) -> str:
+    """
+    Answer `query` over every context chunk and join the answers.
+
+    Each prompt is `header` + chunk + query. Chunks are generated in
+    micro-batches of `batch_size`; `stream=True` (or a batch size of 1)
+    keeps the original one-chunk-at-a-time streaming path with a per-token
+    progress bar. With `use_prefix_cache`, the header and header + chunk
+    key/values come from `prefix_cache` instead of being recomputed.
+
+    `on_token` streams the joined answer as it is generated (this forces
+    the one-chunk-at-a-time path); setting `cancel` stops after the current
+    step and returns what was generated so far. `question_reserve` is
+    passed to chunk_prompt_parts.
+
+    A chunk whose generation fails is left out of the answer; `on_error`
+    receives its label and exception, so callers can tell a partial answer
+    from a complete one.
+    """
     print("🧩 Splitting prompt into safe chunks …")
-    chunks = chunk_prompt_for_generation(context, query, max_tokens=2048, generation_tokens=max_new_tokens)
+    parts = chunk_prompt_parts(context, query, max_tokens=2048, generation_tokens=max_new_tokens,
+                               header=header, question_reserve=question_reserve)
+    streaming = stream or batch_size <= 1 or on_token is not None
+    # cached key/values are fed to the torch model; the onnx backend runs its own graph
+    use_prefix_cache = use_prefix_cache and isinstance(generator.model, torch.nn.Module)
+
+    # micro-batches never mix chunk lengths, so cached prefixes stack
+    # without padding (only the last chunk is ever shorter)
+    batches: List[List[int]] = []
+    for i, (_, chunk, _) in enumerate(parts):
+        if (batches and not streaming and len(batches[-1]) < batch_size
+                and len(parts[batches[-1][0]][1]) == len(chunk)):
+            batches[-1].append(i)
+        else:
+            batches.append([i])
 
     all_answers = []
-    for i, chunk in enumerate(progress_iter(chunks, desc="🧠 Chunked generation")):
-        print(f"\n🧠 Generating from chunk {i+1}/{len(chunks)}")
+    done = 0
+    if on_progress:
+        on_progress("generate", 0, len(parts))
+    bar = tqdm(total=len(parts), desc="🧠 Chunked generation") if tqdm else None
+
+    for batch in batches:
+        if cancel is not None and cancel.is_set():
+            print("⏹️  Generation cancelled")
+            break
+        label = f"{batch[0]+1}-{batch[-1]+1}" if len(batch) > 1 else f"{batch[0]+1}"
+        print(f"\n🧠 Generating from chunk {label}/{len(parts)}")
+        prompts = [h + c + q for h, c, q in (parts[i] for i in batch)]
+        gen_kwargs = dict(max_new_tokens=max_new_tokens, do_sample=False, no_repeat_ngram_size=3)
         try:
-            answer = generate_with_progress(chunk, max_new_tokens=max_new_tokens, do_sample=False, no_repeat_ngram_size=3)
-            all_answers.append(answer)
+            if use_prefix_cache:
+                # a prefix miss is a prefill forward pass; bound it like generate
+                with generate_slot():
+                    gen_kwargs["past_key_values"] = stack_caches(
+                        [prefix_cache.get([parts[i][0], parts[i][1]]) for i in batch])
+            if streaming:
+                if on_token and all_answers:
+                    on_token(ANSWER_SEPARATOR)
+                all_answers.append(generate_with_progress(prompts[0], on_token=on_token,
+                                                          cancel=cancel, **gen_kwargs))
+            else:
+                all_answers.extend(generate_batch(prompts, batch_size=len(prompts), **gen_kwargs))
         except Exception as e:
-            print(f"❌ Generation failed on chunk {i+1}: {e}")
-    
-    return "\n\n---\n\n".join(all_answers)
+            print(f"❌ Generation failed on chunk {label}: {e}")
+            if on_error:
+                on_error(label, e)
+        done += len(batch)
+        if bar:
+            bar.update(len(batch))
+        if on_progress:
+            on_progress("generate", done, len(parts))
+    if bar:
+        bar.close()
+
+    return ANSWER_SEPARATOR.join(all_answers)
 
 
 
@@ -248,13 +572,11 @@ def generate_summary(
     Summarise arbitrarily long text by:
       1. tokenising once,
       2. slicing to ≤ `max_in_tokens`,
-      3. feeding those IDs straight into model.generate().
+      3. feeding those IDs straight into the batched summary engine.
     This bypasses any re-tokenisation, so the 1024-token overflow
     warning can never occur.
     """
-    model      = summarizer.model
     tokenizer  = summarizer.tokenizer
-    device     = next(model.parameters()).device          # cpu / cuda / mps
 
     # 1) encode entire document (no special tokens)
     full_ids: list[int] = tokenizer.encode(
@@ -268,31 +590,16 @@ def generate_summary(
         for i in range(0, len(full_ids), max_in_tokens)
     ]
 
-    partials: list[str] = []
-    limit = model.config.max_position_embeddings          # 1024 for distilBART
-
-    for ids in slices:
-        ids = ids[: limit - 2]                            # final clamp (safety)
-
-        # add batch dim & send to the right device
-        input_ids = torch.tensor([ids], dtype=torch.long, device=device)
-
-        with torch.no_grad():
-            out_ids = model.generate(
-                input_ids,
-                max_length=max_out_tokens,
-                min_length=60,
-                no_repeat_ngram_size=3,
-                do_sample=False,
-            )[0]
-
-        partials.append(
-            tokenizer.decode(
-                out_ids,
-                skip_special_tokens=True,
-                clean_up_tokenization_spaces=True,
-            )
-        )
+    # 3) batched (and, with SUMMARY_WORKERS > 1, multi-process) summaries
+    partials = summarise_slices(
+        slices,
+        model=summarizer.model,
+        tokenizer=tokenizer,
+        max_length=max_out_tokens,
+        min_length=60,
+        no_repeat_ngram_size=3,
+        do_sample=False,
+    )
 
     if not partials:
         raise RuntimeError("All chunks failed to summarise")
@@ -301,8 +608,7 @@ def generate_summary(
 
 
 
-def save_to_pdf(text: str, output_path: str) -> None:
-    """Save text to a nicely formatted PDF, stripping non-latin1 characters."""
+def _build_pdf(text: str) -> FPDF:
     pdf = FPDF()
     pdf.add_page()
     pdf.set_font("Arial", size=12)
@@ -311,5 +617,14 @@ def save_to_pdf(text: str, output_path: str) -> None:
         # Replace characters not encodable in Latin-1
         line_clean = line.encode("latin-1", "replace").decode("latin-1")
         pdf.multi_cell(0, 10, line_clean)
+    return pdf
 
-    pdf.output(output_path)
\ No newline at end of file
+def render_pdf(text: str) -> BytesIO:
+    """Render text like save_to_pdf, into an in-memory buffer instead of a file."""
+    out = _build_pdf(text).output(dest="S")
+    # fpdf returns a latin-1 str, fpdf2 a bytearray
+    return BytesIO(out.encode("latin-1") if isinstance(out, str) else bytes(out))
+
+def save_to_pdf(text: str, output_path: str) -> None:
+    """Save text to a nicely formatted PDF, stripping non-latin1 characters."""
+    _build_pdf(text).output(output_path)
@@ -1,30 +1,74 @@
 # app.py
-from fastapi import FastAPI, UploadFile, Form, HTTPException
+from fastapi import FastAPI, UploadFile, Form, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from llmUtils import extract_text_by_type, single_query_answer, chunked_query_answer, save_to_pdf
+from llmUtils import extract_text_by_type, single_query_answer, chunked_query_answer, render_pdf, prefix_cache, EXTRACTOR_VERSION, warm_up, models_ready, build_passage_index, retrieve_context, generator, question_tokens
 from pymongo import MongoClient
 from pymongo.server_api import ServerApi
 import gridfs
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from dotenv import load_dotenv
-from typing import Dict
-from threading import Lock
+from typing import BinaryIO, Dict, Optional
+from threading import Lock, Thread
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
+import time
+import hashlib
 import gridfs
 from bson import ObjectId
+from sessionStore import ensureSessionIndex, addGeneratedFile, findSession as lookupSession
+from jobQueue import JobQueue, QueueFullError, JobCancelled, FINISHED_JOB_TTL
+from extractCache import ExtractCache, digest_key
+from gridfsStream import spool_to_path, put_stream
+from tokenDoc import TokenizedText, tokenizer_key
+from sessionArtifacts import SessionArtifacts
+from resultCache import ResultCache, result_key, RESULT_CACHE_ENABLED
+from transcriptCache import TranscriptCache
+from transcribe import ASR_MODEL_ID
+from modelCache import model_backend, MODEL_MMAP
+from retrieval import PASSAGE_TOKENS
+from tokenStream import TokenStream
+from metrics import registry, request_trace, span, cache_collector
+from workerPools import submit_in_context
 
 load_dotenv()  # Load environment variables from .env file
+EXTRACT_THREADS = int(os.environ.get("EXTRACT_THREADS", "4"))  # files extracted concurrently per request
+GENERATION_TYPE_WORKERS = int(os.environ.get("GENERATION_TYPE_WORKERS", "2"))  # generation types in flight per request
+WARMUP_MODELS = os.environ.get("WARMUP_MODELS", "1") != "0"  # load models at startup, not on first request
+# "chunked" answers over every context chunk; "retrieval" prompts once per
+# generation type with only the passages relevant to it
+CONTEXT_MODE = os.environ.get("CONTEXT_MODE", "chunked")
+GENERATION_TOKENS = 600  # new tokens per chunk answer
+PROMPT_VERSION = 1  # bump when getStudyContent's prompts change, so cached results are not reused
+
 client = MongoClient(os.environ["MONGODB_URL"])  # from env
 db = client["studyAssist"]
 users = db["users"]
 fs = gridfs.GridFS(db, collection="uploads")
+artifacts = SessionArtifacts(db["sessionArtifacts"])
+# finished generations, keyed by everything that decides their output
+result_cache = ResultCache(db["generationResults"])
+# audio transcripts by GridFS id, across sessions
+transcripts = TranscriptCache(db["transcripts"])
 
 app = FastAPI()
 
 # Thread-safe global dictionary
 progress_store: Dict[str, Dict] = {}
 progress_lock = Lock()
+FINISHED_STATUSES = {"done", "failed", "cancelled", "rejected"}
+
+# Generation runs here, off the event loop
+jobs = JobQueue()
+
+# Extracted text, keyed by file content + extractor version
+extract_cache = ExtractCache()
+
+cache_collector("extraction", extract_cache.counter, lambda: extract_cache.stats()["entries"])
+cache_collector("prefix", prefix_cache.counter, lambda: prefix_cache.stats()["entries"])
+cache_collector("result", result_cache.counter, result_cache.collection.estimated_document_count)
+cache_collector("transcript", transcripts.counter, transcripts.collection.estimated_document_count)
     
 app.add_middleware(
     CORSMiddleware,
@@ -34,26 +78,86 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def createIndexes():
+    ensureSessionIndex(users)
+    artifacts.ensureIndexes()
+    result_cache.ensureIndexes()
+
+@app.on_event("startup")
+def warmModels():
+    # in the background so the server accepts /ready and /progress meanwhile
+    if WARMUP_MODELS:
+        Thread(target=warm_up, name="model-warmup", daemon=True).start()
+
+@app.on_event("shutdown")
+def stopJobs():
+    jobs.shutdown(wait=False)
+
+def publishProgress(sessionId: str, generation: Optional[str] = None, **fields):
+    """
+    Update a session's progress. Fields of one generation type go into its
+    own entry under "generations", since several types run at once.
+    """
+    with progress_lock:
+        now = time.time()
+        entry = progress_store.setdefault(sessionId, {})
+        if generation is None:
+            entry.update(fields, updatedAt=now)
+        else:
+            entry.setdefault("generations", {}).setdefault(generation, {}).update(fields, updatedAt=now)
+            entry["updatedAt"] = now
+
+def pruneProgress():
+    """Drop sessions whose last job finished over FINISHED_JOB_TTL ago, like JobQueue does. Caller holds progress_lock."""
+    cutoff = time.time() - FINISHED_JOB_TTL
+    for sessionId in [key for key, entry in progress_store.items()
+                      if entry.get("status") in FINISHED_STATUSES and entry["updatedAt"] < cutoff]:
+        del progress_store[sessionId]
+
 @app.get("/progress/{session_id}")
 def get_progress(session_id: str):
     with progress_lock:
         if session_id not in progress_store:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        return progress_store[session_id]
+        view = dict(progress_store[session_id])
+        generations = {name: dict(fields) for name, fields in view.get("generations", {}).items()}
+        if generations:
+            view["generations"] = generations
+            view["generationsDone"] = sum(1 for fields in generations.values()
+                                          if fields.get("stage") == "upload" and fields.get("done") == fields.get("total"))
+        return view
+
+@app.get("/ready")
+def get_ready():
+    if not models_ready():
+        raise HTTPException(status_code=503, detail="Models are still loading")
+    return {"ready": True}
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {"extraction": extract_cache.stats(), "prefix": prefix_cache.stats(), "result": result_cache.stats(),
+            "transcript": transcripts.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
     
 class GenRequest(BaseModel):
     sessionId: str
     apiKey: str
 
 def findSession(session_id: str):
-    for user in users.find():
-        for session in user.get("sessions", []):
-            if str(session["_id"]) == session_id:
-                print("✅ User found with session ID:", session_id)
-                return session
-    print("❌ Session not found")
-    return None  # Return None if session is not found
+    with span("mongo_lookup"):
+        return lookupSession(users, session_id)
 
 def parseConfigMap(session: str):
     generationDict = {}
@@ -73,6 +177,10 @@ def parseConfigMap(session: str):
     return generationDict
 
 def getFiles(session):
+    """
+    Metadata of the session's uploads. Contents stay in GridFS until
+    extractFileText streams them, so a request never holds every file at once.
+    """
     fileObjects = []
     files = session.get("uploadedFiles", [])
     
@@ -90,8 +198,8 @@ def getFiles(session):
                         "contentType": fileContents.content_type,
                         "size": fileContents.length,
                         "id": str(fileContents._id),
-                        "content": fileContents.read()  # Assuming it's binary data
                     })
+                    fileContents.close()
                 else:
                     print(f"File with _id '{gridFsId}' not found in GridFS.")
             except Exception as e:
@@ -101,6 +209,93 @@ def getFiles(session):
     
     return fileObjects       
     
+def extractFileText(file) -> str:
+    """
+    Extract text from an uploaded file, reusing the cached result when the
+    same bytes were already extracted by the current extractor version.
+
+    The file is spooled chunk-wise from GridFS to a temp file (hashed on the
+    way), and the extractors read it from there. Audio transcripts are also
+    kept by GridFS id, so a known recording is not even spooled.
+    """
+    audio = file['contentType'].startswith("audio/")
+    if audio:
+        # recordings are large and slow to transcribe; skip even the spool on a hit
+        transcript = transcripts.get(file['id'], ASR_MODEL_ID, EXTRACTOR_VERSION)
+        if transcript is not None:
+            print(f"✅ Transcript cache hit: {file['name']}")
+            return transcript
+
+    suffix = os.path.splitext(file['name'])[1]
+    with spool_to_path(fs, file['id'], suffix=suffix) as (path, digest):
+        key = digest_key(digest, file['contentType'], EXTRACTOR_VERSION)
+        extracted_text = extract_cache.get(key)
+        if extracted_text is not None:
+            print(f"✅ Extraction cache hit: {file['name']}")
+        else:
+            extracted_text = extract_text_by_type(path, file['contentType']) or ""
+            extract_cache.put(key, extracted_text)
+    if audio:
+        transcripts.put(file['id'], ASR_MODEL_ID, EXTRACTOR_VERSION, extracted_text)
+    return extracted_text
+
+def fileBlock(file, extracted_text: str) -> str:
+    return f"File Name: {file['name']}\nFile Type: {file['contentType']}\nContent:\n{extracted_text}\n\n"
+
+def buildContext(files, on_progress=None, sessionId: Optional[str] = None) -> TokenizedText:
+    """
+    Extract every file once (concurrently) and join the results into the
+    request's context, in upload order.
+
+    With a `sessionId`, each file's text and block token ids are kept in the
+    session's artifact store: only files without an artifact are extracted
+    and tokenised, and artifacts of files removed from the session are dropped.
+    """
+    tokenizer = generator.tokenizer
+    stored = {}
+    if sessionId:
+        fileIds = [file['id'] for file in files]
+        artifacts.prune(sessionId, fileIds)
+        stored = artifacts.load(sessionId, fileIds, EXTRACTOR_VERSION)
+    missing = [file for file in files if file['id'] not in stored]
+    if stored:
+        print(f"✅ Reusing {len(stored)} stored file artifact(s), extracting {len(missing)}")
+
+    texts = {file['id']: stored[file['id']]["text"] for file in files if file['id'] in stored}
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(EXTRACT_THREADS, len(missing))) as pool:
+            futures = [submit_in_context(pool, extractFileText, file) for file in missing]
+            if on_progress:
+                on_progress("extract", 0, len(missing))
+                for done, _ in enumerate(as_completed(futures), 1):
+                    on_progress("extract", done, len(missing))
+        for file, future in zip(missing, futures):
+            texts[file['id']] = future.result() or ""
+
+    blocks = []
+    for file in files:
+        extracted_text = texts[file['id']]
+        if not extracted_text:
+            print(f"❌ No text extracted from file: {file['name']}")
+            if sessionId and file['id'] not in stored:
+                artifacts.save(sessionId, file['id'], EXTRACTOR_VERSION, "")
+            continue
+
+        block = fileBlock(file, extracted_text)
+        artifact = stored.get(file['id'], {})
+        # the text is the artifact's own, so the block only differs if the file was renamed
+        if artifact.get("fileName") == file['name'] and artifact.get("tokenizer") == tokenizer_key(tokenizer):
+            blocks.append(TokenizedText.from_ids(tokenizer, artifact["blockIds"], block))
+            continue
+
+        doc = TokenizedText(block)
+        if sessionId:
+            artifacts.save(sessionId, file['id'], EXTRACTOR_VERSION, extracted_text,
+                           fileName=file['name'], blockIds=doc.ids(tokenizer), tokenizer=tokenizer_key(tokenizer))
+        blocks.append(doc)
+
+    return TokenizedText.concat(blocks, tokenizer)
+
 def getInstructions(session: str):
     instructions = session.get("instructions", "")
     if not instructions:
@@ -108,100 +303,288 @@ def getInstructions(session: str):
     
     return instructions
     
-def getStudyContent(generation: str, generationConfig: str, generationInstructions, generalInstructions: str, files: str):
-    query: str = f"""Your task is to generate a certain type of study content based on the context of the files that have been provided
-        and the general instructions which are: {generalInstructions}. There are various forms of study content that can be generated,
-        such as study guides, flashcards, practice tests, a list of key terms, practice problems, etc. I need you to generate the following: 
+def getStudyQuery(generation: str, generationConfig: str, generationInstructions) -> str:
+    return f"""I need you to generate the following: 
         {generation}. For this type of study content, you need to follow these instructions: {generationInstructions}. You must also 
         follow the parameters (if any) that have been provided: {generationConfig}. The content that you generate will be converted to
-        a PDF, so please ensure that it is well-structured and formatted. The content of the files have been provided above, these files
-        are very important in setting the focus of the content that you generate. Remember that your response should not be instructions
+        a PDF, so please ensure that it is well-structured and formatted. Remember that your response should not be instructions
         that guide me on how to create the study file, but it should simply be then contents of the file. Remember that you are an expert
         on creating this study content. Please provide the well-formatted content below:""" 
+
+def getStudyContent(generation: str, generationConfig: str, generationInstructions, generalInstructions: str, context: TokenizedText, on_progress=None, on_token=None, cancel=None, passages=None, questionReserve: int = 0):
+    """
+    Generate and render one generation type. Returns the text, its PDF and
+    whether every context chunk produced an answer.
+    """
+    # The header is identical for every generation type in a request and comes
+    # before the file context, so its (and header + chunk) key/values are reused.
+    header: str = f"""Your task is to generate a certain type of study content based on the context of the files that have been provided
+        and the general instructions which are: {generalInstructions}. There are various forms of study content that can be generated,
+        such as study guides, flashcards, practice tests, a list of key terms, practice problems, etc. The content of the files is provided
+        below, these files are very important in setting the focus of the content that you generate.\n\n"""
+
+    query: str = getStudyQuery(generation, generationConfig, generationInstructions)
     
-    # for each file in the context, provide the name, file type, and use the extractt_text_by_type function to extract the text using the files parameter
-    context = ""
-    for file in files:
-        extracted_text = extract_text_by_type(file['content'], file['contentType'])
-        if not extracted_text:
-            print(f"❌ No text extracted from file: {file['name']}")
-            continue
-        context += f"File Name: {file['name']}\nFile Type: {file['contentType']}\nContent:\n{extracted_text}\n\n"
-    
-    # print("Context for generation:", context)
     # print("Query for generation:", query)
+
+    if passages is not None:
+        context = retrieve_context(
+            passages,
+            query=query,
+            search=f"{generation} {generationInstructions} {generationConfig} {generalInstructions}",
+            generation_tokens=GENERATION_TOKENS,
+            header=header,
+            question_reserve=questionReserve
+        )
     
+    failedChunks = []
     response = chunked_query_answer(
         query=query,
-        context=context
+        context=context,
+        max_new_tokens=GENERATION_TOKENS,
+        header=header,
+        on_progress=on_progress,
+        on_token=on_token,
+        cancel=cancel,
+        question_reserve=questionReserve,
+        on_error=lambda label, error: failedChunks.append(label)
     )
     
-    save_to_pdf(
-        text=response,
-        output_path=f"genResults/{generation}_content.pdf"
-    )
+    if on_progress:
+        on_progress("render", 0, 1)
+    with span("render_pdf"):
+        pdf = render_pdf(response)
     
     print("Generated Content:", response)
+    return response, pdf, not failedChunks
 
-def uploadFile(file_path: str, generation:str, sessionId, filename: str = None, content_type: str = "application/pdf") -> ObjectId:
+def uploadFile(content: BinaryIO, generation:str, session, filename: str = None, content_type: str = "application/pdf") -> ObjectId:
     """
-    Uploads a file to GridFS and returns the file ID.
+    Streams a rendered file into GridFS and returns the file ID.
     """
-    if not os.path.isfile(file_path):
-        raise FileNotFoundError(f"File not found: {file_path}")
+    filename = filename or f"{generation}_content.pdf"
 
-    filename = filename or os.path.basename(file_path)
-
-    with open(file_path, "rb") as f:
-        file_id = fs.put(f, filename=filename, content_type=content_type)
-        print(f"✅ Uploaded '{filename}' with GridFS ID: {file_id}")
+    file_id = put_stream(fs, content, filename=filename, content_type=content_type)
+    print(f"✅ Uploaded '{filename}' with GridFS ID: {file_id}")
     
-    session = findSession(sessionId)
     if session:
-        users.update_one(
-            {"sessions._id": session["_id"]},
-            {"$push": {"sessions.$.generatedFiles": {
-                "gridFsId": str(file_id),
-                "fileName": f"{generation}_content.pdf",
-                "fileType": content_type
-            }}}
-        )
+        addGeneratedFile(users, session["_id"], {
+            "gridFsId": str(file_id),
+            "fileName": filename,
+            "fileType": content_type
+        })
         print(f"✅ Updated session with new file ID: {file_id}")
     else:
         print("❌ Session not found for update.")
-        
-    # delete file from genResults folder
-    if os.path.exists(file_path):
-        os.remove(file_path)
 
-@app.post("/generate")
-async def generate(data: GenRequest):
+    return file_id
+
+def relinkCachedResult(resultKey: str, generation: str, session, stream: Optional[TokenStream] = None) -> bool:
+    """
+    Link a cached result's PDF into the session instead of generating it
+    again. False when there is no entry or its file was deleted since.
+    """
+    cached = result_cache.get(resultKey)
+    if cached is None:
+        return False
+    if not fs.exists(ObjectId(cached["gridFsId"])):
+        result_cache.drop(resultKey)
+        return False
+
+    addGeneratedFile(users, session["_id"], {
+        "gridFsId": cached["gridFsId"],
+        "fileName": cached["fileName"],
+        "fileType": cached["fileType"]
+    })
+    print(f"✅ Reused cached {generation} result: {cached['gridFsId']}")
+    if stream:
+        stream.publish("token", {"generation": generation, "text": cached["text"]})
+        stream.publish("file", {"generation": generation, "gridFsId": cached["gridFsId"], "cached": True})
+    return True
+
+def runGeneration(jobId: str, session, stream: Optional[TokenStream] = None):
+    """
+    Worker-side body of a /generate job: extracts, generates, renders and
+    uploads every requested generation type, publishing progress as it goes.
+    Up to GENERATION_TYPE_WORKERS types are in flight at once.
+
+    With a `stream`, each generation type's tokens are also published to it
+    as they are produced, and a disconnected client cancels the job. A job
+    cancelled while queued or extracting stops before the next costly step.
+    """
+    sessionId = str(session["_id"])
+    cancel = stream.cancelled if stream else None
+    cancelled = False
+
+    def stopIfCancelled():
+        if cancel is not None and cancel.is_set():
+            raise JobCancelled("client disconnected")
+
+    publishProgress(sessionId, jobId=jobId, status="running", stage="prepare")
+    if stream:
+        stream.publish("job", {"jobId": jobId, "sessionId": sessionId})
+
+    with request_trace(jobId=jobId, sessionId=sessionId) as trace:
+        try:
+            # the client may have left while the job was queued
+            stopIfCancelled()
+            with span("gridfs_metadata"):
+                files = getFiles(session)
+            instructions = getInstructions(session)
+            generationConfig = parseConfigMap(session)
+            print(generationConfig)
+
+            # extract once; the ids are memoised on the doc and shared by every generation type
+            context = buildContext(files, sessionId=sessionId, on_progress=lambda stage, done, total:
+                                   publishProgress(sessionId, stage=stage, done=done, total=total))
+            stopIfCancelled()
+            # one index per request, queried once per generation type
+            passages = build_passage_index(context) if CONTEXT_MODE == "retrieval" else None
+            contextDigest = hashlib.sha256(context.text.encode()).hexdigest()
+            # room for the longest question, so every type splits the context into
+            # the same chunks and shares their cached prefixes
+            questionReserve = max((question_tokens(getStudyQuery(generation, config, config.get("instructions", "")))
+                                   for generation, config in generationConfig.items()), default=0)
+
+            def runType(index: int, generation: str) -> bool:
+                """Generate, render and upload one generation type; False if the job was cancelled."""
+                print("Generation:", generation)
+
+                def onProgress(stage: str, done: int, total: int):
+                    publishProgress(sessionId, generation=generation, stage=stage, done=done,
+                                    total=total, generationIndex=index)
+
+                onToken = None
+                if stream:
+                    stream.publish("generation", {"generation": generation, "index": index,
+                                                  "count": len(generationConfig)})
+                    onToken = lambda text: stream.publish("token", {"generation": generation, "text": text})
+
+                resultKey = result_key(context=contextDigest, generation=generation,
+                                       generationConfig=generationConfig.get(generation, {}),
+                                       generalInstructions=instructions, model=generator.model_id,
+                                       backend=model_backend(generator.model_id), mmap=MODEL_MMAP,
+                                       contextMode=CONTEXT_MODE, promptVersion=PROMPT_VERSION,
+                                       # chunk boundaries: the reserve depends on the sibling types
+                                       questionReserve=questionReserve, generationTokens=GENERATION_TOKENS,
+                                       passageTokens=PASSAGE_TOKENS if CONTEXT_MODE == "retrieval" else None)
+                if RESULT_CACHE_ENABLED and relinkCachedResult(resultKey, generation, session, stream):
+                    onProgress("upload", 1, 1)
+                    return True
+
+                response, pdf, complete = getStudyContent(
+                    generation=generation,
+                    generationConfig=generationConfig.get(generation, {}),
+                    generationInstructions=generationConfig[generation].get("instructions", ""),
+                    generalInstructions=instructions,
+                    context=context,
+                    on_progress=onProgress,
+                    on_token=onToken,
+                    cancel=cancel,
+                    passages=passages,
+                    questionReserve=questionReserve
+                )
+                if cancel is not None and cancel.is_set():
+                    return False
+
+                onProgress("upload", 0, 1)
+                contentType = "application/pdf"
+                fileId = uploadFile(
+                    content=pdf,
+                    filename=f"{generation}_content.pdf",
+                    content_type=contentType,
+                    generation=generation,
+                    session=session
+                )
+                onProgress("upload", 1, 1)
+                if stream:
+                    stream.publish("file", {"generation": generation, "gridFsId": str(fileId)})
+                # a partial answer is not this key's result; the next request regenerates
+                if RESULT_CACHE_ENABLED and complete:
+                    result_cache.put(resultKey, response, str(fileId),
+                                     fileName=f"{generation}_content.pdf", fileType=contentType)
+                return True
+
+            publishProgress(sessionId, stage="generate", generationCount=len(generationConfig))
+            # types run side by side, so one type's prompt building, rendering and
+            # upload overlap another's generate call; llmUtils.generate_slot bounds
+            # how many generate calls actually run at once. The scope keeps the
+            # request's cached prefixes until every type has used them
+            with prefix_cache.scope(), \
+                 ThreadPoolExecutor(max_workers=max(1, min(GENERATION_TYPE_WORKERS, len(generationConfig)))) as pool:
+                futures = [submit_in_context(pool, runType, index, generation)
+                           for index, generation in enumerate(generationConfig)]
+                try:
+                    finished = [future.result() for future in as_completed(futures)]
+                except Exception:
+                    for future in futures:
+                        future.cancel()
+                    raise
+            if not all(finished):
+                raise JobCancelled("client disconnected")
+            publishProgress(sessionId, status="done", stage="done")
+            if stream:
+                stream.publish("done", {})
+        except JobCancelled:
+            cancelled = True
+            publishProgress(sessionId, status="cancelled")
+            trace.status = "cancelled"
+        except Exception as e:
+            publishProgress(sessionId, status="failed", error=str(e))
+            if stream:
+                stream.publish("error", {"error": str(e)})
+            raise
+        finally:
+            if stream:
+                stream.close()
+    if cancelled:
+        # raised outside the trace, which already recorded the request as cancelled
+        raise JobCancelled("client disconnected")
+
+def queueGeneration(data: GenRequest, stream: Optional[TokenStream] = None) -> str:
+    """
+    Authorise the request, reset its progress and queue runGeneration;
+    returns the job ID. A session runs one job at a time (409 otherwise),
+    since its progress entry is shared.
+    """
     if data.apiKey.strip() != str(os.environ["LLM_API_KEY"]).strip():
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     sessionId = data.sessionId
-    files = (getFiles(findSession(sessionId)))
-    instructions = getInstructions(findSession(sessionId))
-    generationConfig = parseConfigMap(findSession(sessionId))
-    print(generationConfig)
-    
-    for generation in generationConfig:
-        print("Generation:", generation)
-        getStudyContent(
-            generation=generation,
-            generationConfig=generationConfig.get(generation, {}),
-            generationInstructions=generationConfig[generation].get("instructions", ""),
-            generalInstructions=instructions,
-            files=files
-        )
-        
-        contentType = "application/pdf"
-        fileId = uploadFile(
-            file_path=f"genResults/{generation}_content.pdf",
-            filename=f"{generation}_content.pdf",
-            content_type=contentType,
-            generation=generation,
-            sessionId=sessionId
-        )
+    session = findSession(sessionId)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
 
-    return { "message": "Study content generated" }
+    # reset before submitting so a fast worker's updates are never overwritten
+    with progress_lock:
+        pruneProgress()
+        current = progress_store.get(sessionId)
+        if current is not None and current.get("status") not in FINISHED_STATUSES:
+            raise HTTPException(status_code=409, detail="A generation job is already running for this session")
+        progress_store[sessionId] = {"status": "queued", "updatedAt": time.time()}
+    try:
+        jobId = jobs.submit(runGeneration, session, stream)
+    except QueueFullError as e:
+        publishProgress(sessionId, status="rejected", error=str(e))
+        raise HTTPException(status_code=503, detail=str(e))
+    publishProgress(sessionId, jobId=jobId)
+    return jobId
+
+@app.post("/generate", status_code=status.HTTP_202_ACCEPTED)
+def generate(data: GenRequest):
+    jobId = queueGeneration(data)
+    return { "message": "Study content generation queued", "jobId": jobId, "sessionId": data.sessionId }
+
+@app.post("/generate/stream")
+def generateStream(data: GenRequest, request: Request):
+    """
+    Same job as /generate, answered as Server-Sent Events: `generation` when a
+    type starts, `token` for each piece of text, `file` once its PDF is
+    stored, then `done` (or `error`). The job ID arrives first as `job`.
+    Closing the connection cancels the job; a client too slow to keep up
+    is cancelled and gets a final `cancelled` event.
+    """
+    stream = TokenStream()
+    queueGeneration(data, stream)
+    return StreamingResponse(stream.events(request.is_disconnected), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# "-" logs one JSON line per request to stdout, any other value is a file to append to
+METRICS_JSON_LOG = os.environ.get("METRICS_JSON_LOG", "")
+
+PREFIX = "smartstudy"
+STAGE_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RATE_BUCKETS  = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Registry:
+    """
+    Counters and histograms kept in process, rendered in the Prometheus
+    text exposition format. Collectors add values that are read at scrape
+    time (e.g. cache statistics) instead of being pushed.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}                   # name -> (type, help)
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Tuple[tuple, Dict[Labels, List[float]]]] = {}
+        self._collectors: List[Callable[[], Iterator[Tuple[str, str, str, Dict, float]]]] = []
+
+    def counter(self, name: str, help: str):
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, help: str, buckets: tuple = STAGE_BUCKETS):
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            self._histograms.setdefault(name, (buckets, {}))
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            buckets, series = self._histograms[name]
+            # per-bucket counts (+Inf last), then sum and count
+            values = series.setdefault(key, [0] * (len(buckets) + 1) + [0.0, 0])
+            values[bisect_left(buckets, value)] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def collector(self, fn: Callable[[], Iterator[Tuple[str, str, str, Dict, float]]]):
+        """`fn` yields (name, type, help, labels, value) samples at scrape time."""
+        with self._lock:
+            self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in self._counters.items():
+                kind, help = self._help[name]
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                lines += [f"{name}{_format_labels(k)} {v}" for k, v in series.items()]
+
+            for name, (buckets, series) in self._histograms.items():
+                kind, help = self._help[name]
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                for key, values in series.items():
+                    cumulative = 0
+                    for bound, count in zip(list(buckets) + ["+Inf"], values):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {values[-2]}")
+                    lines.append(f"{name}_count{_format_labels(key)} {values[-1]}")
+            collectors = list(self._collectors)
+
+        # samples of one metric must be contiguous, whichever collector yields them
+        families: Dict[str, List[str]] = {}
+        for fn in collectors:
+            for name, kind, help, labels, value in fn():
+                family = families.setdefault(name, [f"# HELP {name} {help}", f"# TYPE {name} {kind}"])
+                family.append(f"{name}{_format_labels(_labels(labels))} {value}")
+        for family in families.values():
+            lines += family
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+registry.histogram(f"{PREFIX}_stage_seconds", "Time spent in each pipeline stage.")
+registry.counter(f"{PREFIX}_requests_total", "Generation requests by final status.")
+registry.histogram(f"{PREFIX}_request_seconds", "End-to-end time of generation requests.")
+registry.counter(f"{PREFIX}_prompt_tokens_total", "Prompt tokens fed to model.generate.")
+registry.counter(f"{PREFIX}_generated_tokens_total", "Tokens produced by model.generate.")
+registry.histogram(f"{PREFIX}_generate_tokens_per_second",
+                   "Generated tokens per second of each model.generate call.", RATE_BUCKETS)
+
+
+class RequestTrace:
+    """Per-request totals, written as one JSON log line when the request ends."""
+
+    def __init__(self, **fields):
+        self.fields = dict(fields, requestId=fields.get("requestId") or uuid.uuid4().hex)
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.tokens = {"prompt": 0, "generated": 0, "generateSeconds": 0.0}
+        self.status = "done"        # reported if the block exits normally
+        self._lock = Lock()
+
+    def add_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_generation(self, prompt_tokens: int, new_tokens: int, seconds: float):
+        with self._lock:
+            self.tokens["prompt"] += prompt_tokens
+            self.tokens["generated"] += new_tokens
+            self.tokens["generateSeconds"] += seconds
+
+    def record(self, status: str) -> Dict:
+        with self._lock:
+            seconds = self.tokens["generateSeconds"]
+            return dict(self.fields, status=status,
+                        seconds=round(time.perf_counter() - self.started, 4),
+                        stages={k: round(v, 4) for k, v in self.stages.items()},
+                        promptTokens=self.tokens["prompt"],
+                        generatedTokens=self.tokens["generated"],
+                        tokensPerSecond=round(self.tokens["generated"] / seconds, 2) if seconds else None)
+
+
+_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+_log_lock = Lock()
+
+
+@contextmanager
+def request_trace(**fields) -> Iterator[RequestTrace]:
+    """
+    Attribute spans and generate calls in this context to one request.
+    Worker threads see it if started with contextvars.copy_context().run.
+    """
+    trace = RequestTrace(**fields)
+    token = _trace.set(trace)
+    status = "failed"
+    try:
+        yield trace
+        status = trace.status
+    finally:
+        _trace.reset(token)
+        record = trace.record(status)
+        registry.inc(f"{PREFIX}_requests_total", status=status)
+        registry.observe(f"{PREFIX}_request_seconds", record["seconds"])
+        _log(record)
+
+
+def _log(record: Dict):
+    if not METRICS_JSON_LOG:
+        return
+    line = json.dumps(record)
+    with _log_lock:
+        if METRICS_JSON_LOG == "-":
+            print(line, file=sys.stdout, flush=True)
+        else:
+            with open(METRICS_JSON_LOG, "a") as f:
+                f.write(line + "\n")
+
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage, into the stage histogram and the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe(f"{PREFIX}_stage_seconds", seconds, stage=stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add_stage(stage, seconds)
+
+
+def record_generation(prompt_tokens: int, new_tokens: int, seconds: float):
+    """Token counts and throughput of one model.generate call."""
+    registry.inc(f"{PREFIX}_prompt_tokens_total", prompt_tokens)
+    registry.inc(f"{PREFIX}_generated_tokens_total", new_tokens)
+    if seconds > 0:
+        registry.observe(f"{PREFIX}_generate_tokens_per_second", new_tokens / seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add_generation(prompt_tokens, new_tokens, seconds)
+
+
+class HitCounter:
+    """Hits and misses of one cache's lookups, safe to count from several threads."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict:
+        """hits, misses and hitRate, for a cache's stats()."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {"hits": hits, "misses": misses, "hitRate": hits / lookups if lookups else 0.0}
+
+
+def cache_collector(name: str, counter: HitCounter, entries: Callable[[], int]):
+    """Expose a cache's hits/misses and its `entries()` count at scrape time."""
+    def collect():
+        s = counter.stats()
+        labels = {"cache": name}
+        yield f"{PREFIX}_cache_hits_total", "counter", "Cache lookups that hit.", labels, s["hits"]
+        yield f"{PREFIX}_cache_misses_total", "counter", "Cache lookups that missed.", labels, s["misses"]
+        yield f"{PREFIX}_cache_hit_ratio", "gauge", "Hits over lookups since start.", labels, s["hitRate"]
+        yield f"{PREFIX}_cache_entries", "gauge", "Entries currently cached.", labels, entries()
+    return registry.collector(collect)
@@ -1,21 +1,275 @@
+import os
+import json
+import mmap
+import struct
+import shutil
+import tempfile
 from pathlib import Path
-from transformers import pipeline, Pipeline
+from threading import Lock
+from transformers import pipeline, Pipeline, AutoConfig, AutoTokenizer, AutoFeatureExtractor, AutoModelForCausalLM, AutoModelForSeq2SeqLM, AutoModelForSpeechSeq2Seq, GenerationConfig
+from transformers.modeling_utils import no_init_weights
 from huggingface_hub import snapshot_download
+import torch
 
 PROJECT_CACHE_ROOT = Path(__file__).resolve().parent / ".models"
 
-def load_pipeline(task: str, model_id: str, *,
-                  local_subdir: str | None = None,
-                  device: int | str | None = None) -> Pipeline:
-    """
-    Download once into models/<subdir>; return ready pipeline.
-    """
+# Map safetensors weights copy-on-write instead of reading them into private
+# memory, so several worker processes share one copy in the page cache.
+MODEL_MMAP = os.environ.get("MODEL_MMAP", "0") == "1"
+
+# Inference backend per model: "fp32" (the plain pipeline), "int8" (dynamic
+# quantisation of the Linear layers), "compile" (torch.compile) or "onnx"
+# (ONNX Runtime, needs optimum[onnxruntime]). MODEL_BACKEND is the default;
+# MODEL_BACKENDS overrides it per model, e.g.
+# "sshleifer/distilbart-cnn-6-6=int8,EleutherAI/gpt-neo-125M=onnx".
+# Converted models are kept next to the snapshot in .models/<name>.<backend>.
+BACKENDS = ("fp32", "int8", "compile", "onnx")
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "fp32")
+MODEL_BACKENDS = dict(item.strip().split("=", 1)
+                      for item in os.environ.get("MODEL_BACKENDS", "").split(",") if "=" in item)
+
+_MODEL_CLASSES = {
+    "text-generation": AutoModelForCausalLM,
+    "summarization":   AutoModelForSeq2SeqLM,
+    "automatic-speech-recognition": AutoModelForSpeechSeq2Seq,
+}
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+    "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+
+def _snapshot_dir(model_id: str, local_subdir: str | None) -> Path:
     local_dir = PROJECT_CACHE_ROOT / (local_subdir or model_id.replace("/", "--"))
     if not local_dir.exists():
         snapshot_download(repo_id=model_id,
                           local_dir=local_dir,
                           local_dir_use_symlinks=False)
+    return local_dir
+
+
+def _safetensors_files(local_dir: Path) -> list[Path]:
+    index = local_dir / "model.safetensors.index.json"
+    if index.exists():
+        weight_map = json.loads(index.read_text())["weight_map"]
+        return [local_dir / name for name in sorted(set(weight_map.values()))]
+    single = local_dir / "model.safetensors"
+    return [single] if single.exists() else []
+
+
+def _mmap_safetensors(path: Path) -> dict:
+    """Tensors backed directly by a copy-on-write mapping of `path`."""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    header_len = struct.unpack("<Q", mapped[:8])[0]
+    header = json.loads(mapped[8:8 + header_len])
+    base = 8 + header_len
+
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        if end == start:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        tensors[name] = torch.frombuffer(mapped, dtype=dtype, count=count,
+                                         offset=base + start).reshape(info["shape"])
+    return tensors
+
+
+def _load_mmap_model(task: str, local_dir: Path):
+    """
+    Build the model skeleton without initialising weights, then point its
+    parameters at the mapped tensors. Returns None when the snapshot cannot
+    be loaded this way (no safetensors, unknown task, missing weights).
+    """
+    files = _safetensors_files(local_dir)
+    model_class = _MODEL_CLASSES.get(task)
+    if not files or model_class is None:
+        return None
+
+    state = {}
+    for path in files:
+        state.update(_mmap_safetensors(path))
+
+    config = AutoConfig.from_pretrained(local_dir)
+    with no_init_weights():
+        model = model_class.from_config(config)
+    missing, _ = model.load_state_dict(state, strict=False, assign=True)
+    model.tie_weights()
+
+    # missing keys are fine only if tie_weights pointed them at loaded tensors
+    loaded = {t.data_ptr() for t in state.values()}
+    params = model.state_dict()
+    if any(params[key].data_ptr() not in loaded for key in missing):
+        print(f"⚠️  Memory-mapped load of {local_dir.name} is missing weights, loading normally")
+        return None
+
+    if (local_dir / "generation_config.json").exists():
+        model.generation_config = GenerationConfig.from_pretrained(local_dir)
+    return model.eval()
+
+
+def model_backend(model_id: str) -> str:
+    backend = MODEL_BACKENDS.get(model_id, MODEL_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r} for {model_id}, expected one of {BACKENDS}")
+    return backend
+
+
+def _artifact_dir(local_dir: Path, backend: str) -> Path:
+    return local_dir.with_name(f"{local_dir.name}.{backend}")
+
+
+def _quantize(model):
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_int8_model(task: str, local_dir: Path):
+    """
+    Model with int8 dynamically quantised Linear layers. The quantised
+    weights are saved on first load; later loads build the skeleton and
+    read them back without ever materialising the fp32 weights.
+    """
+    model_class = _MODEL_CLASSES.get(task)
+    if model_class is None:
+        return None
+
+    weights = _artifact_dir(local_dir, "int8") / "model.pt"
+    if weights.exists():
+        with no_init_weights():
+            model = _quantize(model_class.from_config(AutoConfig.from_pretrained(local_dir)).eval())
+        model.load_state_dict(torch.load(weights, weights_only=True))
+    else:
+        print(f"⏳ Quantising {local_dir.name} to int8 …")
+        model = _quantize(model_class.from_pretrained(local_dir).eval())
+        weights.parent.mkdir(exist_ok=True)
+        partial = weights.with_suffix(f".{os.getpid()}.tmp")
+        torch.save(model.state_dict(), partial)
+        os.replace(partial, weights)
+
+    if (local_dir / "generation_config.json").exists():
+        model.generation_config = GenerationConfig.from_pretrained(local_dir)
+    return model
+
+
+def _compile(model):
+    # the graphs inductor builds are cached on disk, so restarts skip most of the compile
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(PROJECT_CACHE_ROOT / ".inductor"))
+    # prompt and cache lengths change every step; compile for dynamic shapes up front
+    model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+
+def _load_onnx_model(task: str, local_dir: Path):
+    """
+    ONNX Runtime model, exported from the snapshot on first load. Returns
+    None when optimum[onnxruntime] is not installed.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForCausalLM, ORTModelForSeq2SeqLM, ORTModelForSpeechSeq2Seq
+    except ImportError:
+        print("⚠️  optimum[onnxruntime] is not installed, loading the fp32 model")
+        return None
+    model_class = {"text-generation": ORTModelForCausalLM,
+                   "summarization":   ORTModelForSeq2SeqLM,
+                   "automatic-speech-recognition": ORTModelForSpeechSeq2Seq}.get(task)
+    if model_class is None:
+        return None
+
+    onnx_dir = _artifact_dir(local_dir, "onnx")
+    if not (onnx_dir / "config.json").exists():
+        print(f"⏳ Exporting {local_dir.name} to ONNX …")
+        # export next to the final directory and move it in place in one step,
+        # so a concurrent loader never sees a half-written export
+        partial = Path(tempfile.mkdtemp(dir=local_dir.parent, prefix=f"{onnx_dir.name}."))
+        model_class.from_pretrained(local_dir, export=True).save_pretrained(partial)
+        try:
+            partial.rename(onnx_dir)
+        except OSError:               # another process finished first
+            shutil.rmtree(partial, ignore_errors=True)
+    return model_class.from_pretrained(onnx_dir)
+
+
+def load_pipeline(task: str, model_id: str, *,
+                  local_subdir: str | None = None,
+                  device: int | str | None = None,
+                  use_mmap: bool = MODEL_MMAP,
+                  backend: str | None = None) -> Pipeline:
+    """
+    Download once into models/<subdir>; return ready pipeline on the
+    model's inference backend (see MODEL_BACKENDS).
+    """
+    backend = backend or model_backend(model_id)
+    local_dir = _snapshot_dir(model_id, local_subdir)
+
+    model = None
+    if backend == "int8":
+        model = _load_int8_model(task, local_dir)
+    elif backend == "onnx":
+        model = _load_onnx_model(task, local_dir)
+    if model is None and use_mmap:
+        model = _load_mmap_model(task, local_dir)
+    if backend == "compile":
+        model = _compile(model or _MODEL_CLASSES[task].from_pretrained(local_dir).eval())
+
+    if model is not None:
+        # speech models also need their feature extractor handed over
+        extra = ({"feature_extractor": AutoFeatureExtractor.from_pretrained(local_dir)}
+                 if task == "automatic-speech-recognition" else {})
+        return pipeline(task,
+                        model=model,
+                        tokenizer=AutoTokenizer.from_pretrained(local_dir),
+                        device=device,
+                        **extra)
     return pipeline(task,
                     model=str(local_dir),
                     tokenizer=str(local_dir),
-                    device=device)
\ No newline at end of file
+                    device=device)
+
+
+class LazyPipeline:
+    """
+    Thread-safe handle that loads its pipeline on first use.
+
+    Attribute access (`.model`, `.tokenizer`, ...) and calls are forwarded to
+    the loaded pipeline, so it can stand in wherever a Pipeline was used.
+    """
+
+    def __init__(self, task: str, model_id: str, **load_kwargs):
+        self.task = task
+        self.model_id = model_id
+        self._load_kwargs = load_kwargs
+        self._pipeline: Pipeline | None = None
+        self._lock = Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._pipeline is not None
+
+    def get(self) -> Pipeline:
+        if self._pipeline is None:
+            with self._lock:
+                if self._pipeline is None:
+                    print(f"⏳ Loading {self.model_id} …")
+                    self._pipeline = load_pipeline(self.task, self.model_id, **self._load_kwargs)
+        return self._pipeline
+
+    def __getattr__(self, name):
+        if name.startswith("_"):          # never load for private/dunder lookups
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.get()(*args, **kwargs)
+
+
+def lazy_pipeline(task: str, model_id: str, **load_kwargs) -> LazyPipeline:
+    """Like load_pipeline, but nothing is downloaded or loaded until first use."""
+    return LazyPipeline(task, model_id, **load_kwargs)
@@ -0,0 +1,132 @@
+import os
+from typing import Iterator, List, NamedTuple
+
+import pytesseract
+from PIL import Image, ImageOps, ImageSequence
+
+from metrics import span
+from workerPools import map_ordered
+
+OCR_WORKERS        = int(os.environ.get("OCR_WORKERS", "2"))            # Tesseract processes per image file
+OCR_TIMEOUT        = int(os.environ.get("OCR_TIMEOUT_SECONDS", "60"))   # per frame; the frame is skipped after it
+OCR_MIN_CONFIDENCE = float(os.environ.get("OCR_MIN_CONFIDENCE", "50"))  # regions below this mean word confidence are dropped
+OCR_MAX_FRAMES     = int(os.environ.get("OCR_MAX_FRAMES", "100"))       # pages read from a multi-page TIFF/GIF
+# Pixel budget each frame is scaled into: a 12 MP photo is mostly wasted
+# Tesseract time, a small screenshot is too coarse for it to read
+OCR_MAX_PIXELS     = 4_000_000
+OCR_MIN_PIXELS     = 1_000_000
+
+
+class OcrRegion(NamedTuple):
+    text: str
+    confidence: float       # mean Tesseract word confidence, 0-100
+
+
+def _otsu_threshold(gray: Image.Image) -> int:
+    """Grey level that best separates ink from paper (Otsu's method)."""
+    histogram = gray.histogram()
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+
+    best, best_variance = 127, 0.0
+    background = weighted_background = 0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += level * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best, best_variance = level, variance
+    return best
+
+
+def preprocess(image: Image.Image) -> Image.Image:
+    """Upright, grayscale, resolution-normalised, binarised copy of `image`."""
+    image = ImageOps.exif_transpose(image)
+    gray = ImageOps.autocontrast(image.convert("L"))
+
+    pixels = gray.width * gray.height
+    scale = 1.0
+    if pixels > OCR_MAX_PIXELS:
+        scale = (OCR_MAX_PIXELS / pixels) ** 0.5
+    elif pixels < OCR_MIN_PIXELS:
+        scale = (OCR_MIN_PIXELS / pixels) ** 0.5
+    if scale != 1.0:
+        size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+        gray = gray.resize(size, Image.Resampling.LANCZOS if scale < 1 else Image.Resampling.BICUBIC)
+
+    threshold = _otsu_threshold(gray)
+    return gray.point(lambda level: 255 if level > threshold else 0, mode="1")
+
+
+def ocr_regions(image: Image.Image, timeout: int = OCR_TIMEOUT) -> List[OcrRegion]:
+    """
+    OCR one (preprocessed) frame into its text regions (Tesseract
+    paragraphs), in reading order, each with its mean word confidence.
+    """
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, timeout=timeout)
+
+    regions = {}
+    for word, conf, block, par, line in zip(data["text"], data["conf"], data["block_num"],
+                                            data["par_num"], data["line_num"]):
+        conf = float(conf)
+        if conf < 0 or not word.strip():        # -1 marks layout rows, not words
+            continue
+        lines, confs = regions.setdefault((block, par), ({}, []))
+        lines.setdefault(line, []).append(word)
+        confs.append(conf)
+
+    return [OcrRegion("\n".join(" ".join(words) for words in lines.values()), sum(confs) / len(confs))
+            for lines, confs in regions.values()]
+
+
+def iter_frames(image: Image.Image, max_frames: int = OCR_MAX_FRAMES) -> Iterator[Image.Image]:
+    """Every page of a multi-page image (TIFF, GIF, ...), or the image itself."""
+    for index, frame in enumerate(ImageSequence.Iterator(image)):
+        if index >= max_frames:
+            print(f"⚠️  Image OCR capped at {max_frames} frames")
+            return
+        yield frame.copy()
+
+
+def _frame_text(frame: Image.Image, index: int, min_confidence: float) -> str:
+    try:
+        with span("ocr"):
+            regions = ocr_regions(preprocess(frame))
+    except RuntimeError as e:                   # pytesseract's timeout
+        print(f"⚠️  OCR failed on frame {index + 1}: {e}")
+        return ""
+    kept = [region.text for region in regions if region.confidence >= min_confidence]
+    if len(kept) < len(regions):
+        print(f"🧹 Dropped {len(regions) - len(kept)} low-confidence OCR region(s) on frame {index + 1}")
+    return "\n\n".join(kept)
+
+
+def extract_image_text(path: str,
+                       *,
+                       min_confidence: float = OCR_MIN_CONFIDENCE,
+                       workers: int = OCR_WORKERS) -> str:
+    """
+    OCR every frame of the image at `path`, keeping only regions whose
+    confidence reaches `min_confidence`. Frames are read one at a time and
+    preprocessed and recognised `workers` at a time; each Tesseract call is
+    a separate process, so threads are enough to run them in parallel. At
+    most 2 x `workers` frames are held in memory.
+    """
+    def read(indexed):
+        index, frame = indexed
+        return _frame_text(frame, index, min_confidence)
+
+    with Image.open(path) as image:
+        frames = enumerate(iter_frames(image))
+        if getattr(image, "n_frames", 1) == 1 or workers <= 1:
+            texts = [read(frame) for frame in frames]
+        else:
+            texts = list(map_ordered(read, frames, workers))
+    return "\n\n".join(text for text in texts if text)
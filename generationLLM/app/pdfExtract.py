@@ -0,0 +1,113 @@
+import os
+import tempfile
+from concurrent.futures import wait
+from io import BytesIO
+from typing import Iterator, List, Union
+
+import pdfplumber
+import pytesseract
+
+from metrics import span
+from workerPools import SharedProcessPool
+
+PDF_MAX_PAGES      = int(os.environ.get("PDF_MAX_PAGES", "500"))        # pages read per document
+PDF_MAX_CHARS      = int(os.environ.get("PDF_MAX_CHARS", "2000000"))    # characters kept per document
+PDF_WORKERS        = int(os.environ.get("PDF_WORKERS", "1"))            # >1 spreads page ranges over processes
+PDF_PAGES_PER_TASK = 8                                                  # pages handed to a worker at a time
+OCR_RESOLUTION     = 200                                                # DPI for pages without a text layer
+
+PdfSource = Union[bytes, str, os.PathLike]
+
+
+def _open(source: PdfSource):
+    return pdfplumber.open(BytesIO(source) if isinstance(source, bytes) else source)
+
+
+def _page_text(page) -> str:
+    """Text layer of one page, falling back to OCR only when it has none."""
+    text = page.extract_text() or ""
+    if text.strip() or page.chars:
+        return text
+
+    try:
+        with span("ocr"):
+            image = page.to_image(resolution=OCR_RESOLUTION).original
+            return pytesseract.image_to_string(image)
+    except Exception as e:
+        print(f"⚠️  OCR fallback failed on page {page.page_number}: {e}")
+        return ""
+
+
+def _extract_range(source: PdfSource, start: int, stop: int) -> List[str]:
+    texts = []
+    with _open(source) as pdf:
+        for index in range(start, stop):
+            page = pdf.pages[index]
+            texts.append(_page_text(page))
+            page.close()                    # drop the page's cached layout objects
+    return texts
+
+
+_pool = SharedProcessPool(PDF_WORKERS)
+
+def _pages_parallel(path: str, page_count: int) -> Iterator[str]:
+    pool = _pool.get()
+    futures = [pool.submit(_extract_range, path, start, min(start + PDF_PAGES_PER_TASK, page_count))
+               for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+    try:
+        for future in futures:              # in page order, as soon as each range is ready
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        wait(futures)                       # ranges already running still read the file
+
+
+def _iter_sequential(source: PdfSource, max_pages: int) -> Iterator[str]:
+    with _open(source) as pdf:
+        for page in pdf.pages[:max_pages]:
+            yield _page_text(page)
+            page.close()
+
+
+def iter_pdf_pages(source: PdfSource,
+                   *,
+                   max_pages: int = PDF_MAX_PAGES,
+                   max_chars: int = PDF_MAX_CHARS,
+                   workers: int = PDF_WORKERS) -> Iterator[str]:
+    """
+    Yield the text of each page in order, without holding the whole
+    document's text or page objects at once.
+
+    Stops after `max_pages` pages or `max_chars` characters (the last page
+    is truncated to fit). With `workers` > 1, page ranges are extracted in
+    the pool of PDF_WORKERS processes while earlier pages are already being yielded.
+    """
+    tmp_path = None
+    pages = None
+    if workers > 1:
+        with _open(source) as pdf:
+            page_count = min(len(pdf.pages), max_pages)
+        if page_count > PDF_PAGES_PER_TASK:
+            if isinstance(source, bytes):
+                # hand workers a path instead of pickling the document per task
+                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                    tmp.write(source)
+                tmp_path = tmp.name
+            pages = _pages_parallel(tmp_path or os.fspath(source), page_count)
+    if pages is None:
+        pages = _iter_sequential(source, max_pages)
+
+    remaining = max_chars
+    try:
+        for text in pages:
+            if len(text) >= remaining:
+                yield text[:remaining]
+                print(f"⚠️  PDF text capped at {max_chars} characters")
+                return
+            remaining -= len(text)
+            yield text
+    finally:
+        pages.close()
+        if tmp_path:
+            os.remove(tmp_path)
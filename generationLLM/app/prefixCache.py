@@ -0,0 +1,206 @@
+import os
+import hashlib
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import torch
+from transformers import DynamicCache
+
+from metrics import HitCounter
+
+PREFIX_CACHE_ENABLED = os.environ.get("PREFIX_CACHE", "1") != "0"
+# Memory cost: gpt-neo-125M keeps about 72 KiB of keys/values per cached
+# token, and every uvicorn worker holds its own cache next to its own ~1.7 GB
+# of models. The defaults stay small (about 150 MB, 300 MB while a request
+# pins its entries); raise them per worker where the memory is there.
+# Bound on cached prefix tokens across all entries; 2048 tokens ≈ 150 MB.
+PREFIX_CACHE_TOKENS  = int(os.environ.get("PREFIX_CACHE_TOKENS", "2048"))
+# Entries a running request still needs may take the cache up to this many
+# tokens (4096 ≈ 300 MB); see PrefixCache.scope.
+PREFIX_CACHE_MAX_TOKENS = int(os.environ.get("PREFIX_CACHE_MAX_TOKENS", "4096"))
+
+
+def _key(ids: List[int]) -> bytes:
+    return hashlib.sha1(array("q", ids).tobytes()).digest()
+
+
+def _clone(cache: DynamicCache) -> DynamicCache:
+    # generate() appends to a cache by torch.cat, never in place, so a new
+    # container around the same tensors is enough to keep the entry intact
+    return DynamicCache.from_legacy_cache(cache.to_legacy_cache())
+
+
+def stack_caches(caches: List[DynamicCache]) -> DynamicCache:
+    """Batch equal-length prefix caches into one cache (batch dim 0)."""
+    if len(caches) == 1:
+        return caches[0]
+    layers = zip(*(cache.to_legacy_cache() for cache in caches))
+    return DynamicCache.from_legacy_cache(tuple(
+        (torch.cat([k for k, _ in layer]), torch.cat([v for _, v in layer]))
+        for layer in layers
+    ))
+
+
+class PrefixCache:
+    """
+    LRU of past key values for prompt prefixes.
+
+    A prefix is given as segments (e.g. [header_ids, chunk_ids]); every
+    cumulative prefix is cached, so the header is computed once for all
+    chunks and header + chunk once for all generation types. Entries are
+    evicted oldest-first once more than `max_tokens` tokens are cached.
+
+    A request with more chunks than fit would cycle every entry out before
+    the next generation type reaches it, so entries used inside `scope()`
+    are pinned until the scope ends: they are never evicted, and may take
+    the cache up to `hard_max_tokens`. Past that, new prefixes are simply
+    not admitted, which keeps the ones already cached for later types.
+
+    `model` may be the model itself or a zero-argument function returning
+    it, so a lazily loaded model is only loaded on the first lookup.
+    """
+
+    def __init__(self, model, max_tokens: int = PREFIX_CACHE_TOKENS,
+                 hard_max_tokens: int = PREFIX_CACHE_MAX_TOKENS):
+        self._model = model
+        self.max_tokens = max_tokens
+        self.hard_max_tokens = max(hard_max_tokens, max_tokens)
+        self.counter = HitCounter()
+        self._lock = Lock()
+        self._entries: "OrderedDict[bytes, Tuple[int, DynamicCache]]" = OrderedDict()
+        self._tokens = 0
+        self._pins: Dict[bytes, int] = {}           # key -> scopes using it
+        self._computing: Dict[bytes, Lock] = {}     # one get() per prefix at a time
+        # keys the current scope() has pinned in this cache; per instance, so a
+        # scope on one cache never pins entries of another
+        self._scope: ContextVar[Optional[Set[bytes]]] = ContextVar(f"prefix_cache_scope_{id(self)}",
+                                                                   default=None)
+
+    @property
+    def model(self) -> torch.nn.Module:
+        if isinstance(self._model, torch.nn.Module):
+            return self._model
+        return self._model()
+
+    @contextmanager
+    def scope(self) -> Iterator[None]:
+        """
+        Pin every entry looked up or stored in this context (and in threads
+        started from it with contextvars.copy_context) until it exits.
+        """
+        keys: Set[bytes] = set()
+        token = self._scope.set(keys)
+        try:
+            yield
+        finally:
+            self._scope.reset(token)
+            with self._lock:
+                for key in keys:
+                    if self._pins.get(key, 0) <= 1:
+                        self._pins.pop(key, None)
+                    else:
+                        self._pins[key] -= 1
+                self._evict(self.max_tokens)
+
+    def clear(self):
+        """Drop every entry and reset the hit counters. Not for use while a scope() is open."""
+        with self._lock:
+            self._entries.clear()
+            self._pins.clear()
+            self._tokens = 0
+        self.counter.reset()
+
+    def _pin(self, key: bytes):
+        # caller holds self._lock
+        keys = self._scope.get()
+        if keys is not None and key not in keys:
+            keys.add(key)
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def _evict(self, limit: int):
+        # caller holds self._lock; oldest unpinned entries first
+        for key in [k for k in self._entries if k not in self._pins]:
+            if self._tokens <= limit:
+                break
+            old_len, _ = self._entries.pop(key)
+            self._tokens -= old_len
+
+    def _lookup(self, key: bytes) -> Optional[DynamicCache]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._pin(key)
+            return entry[1]
+
+    def _store(self, key: bytes, length: int, cache: DynamicCache):
+        with self._lock:
+            if key in self._entries:
+                return
+            limit = self.hard_max_tokens if self._scope.get() is not None else self.max_tokens
+            if length > limit:
+                return
+            self._evict(self.max_tokens - length)
+            if self._tokens + length > limit:
+                return                      # full of pinned entries: do not admit
+            self._entries[key] = (length, cache)
+            self._tokens += length
+            self._pin(key)
+
+    def _extend(self, past: Optional[DynamicCache], ids: List[int]) -> DynamicCache:
+        cache = _clone(past) if past is not None else DynamicCache()
+        device = next(self.model.parameters()).device
+        with torch.no_grad():
+            self.model(input_ids=torch.tensor([ids], dtype=torch.long, device=device),
+                       past_key_values=cache, use_cache=True)
+        return cache
+
+    def _walk(self, segments: List[List[int]]) -> Tuple[Optional[DynamicCache], bool]:
+        """Cached (or newly computed) key/values for all of `segments`; whether all were cached."""
+        prefix: List[int] = []
+        cache: Optional[DynamicCache] = None
+        hit = True
+        for segment in segments:
+            prefix = prefix + segment
+            key = _key(prefix)
+            found = self._lookup(key)
+            if found is None:
+                hit = False
+                found = self._extend(cache, segment)
+                self._store(key, len(prefix), found)
+            cache = found
+        return cache, hit
+
+    def get(self, segments: List[List[int]]) -> DynamicCache:
+        """
+        Past key values for the concatenation of `segments`, as a fresh
+        cache the caller may hand to model.generate(). Concurrent lookups
+        of the same prefix wait for the first one and reuse what it cached.
+        """
+        segments = [segment for segment in segments if segment]
+        key = _key([token for segment in segments for token in segment])
+        with self._lock:
+            computing = self._computing.setdefault(key, Lock())
+        with computing:
+            cache, hit = self._walk(segments)
+        with self._lock:
+            if self._computing.get(key) is computing and not computing.locked():
+                del self._computing[key]
+        self.counter.record(hit)
+        return _clone(cache) if cache is not None else DynamicCache()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.counter.stats(),
+                "entries": len(self._entries),
+                "tokens": self._tokens,
+                "pinned": len(self._pins),
+                "maxTokens": self.max_tokens,
+                "hardMaxTokens": self.hard_max_tokens,
+            }
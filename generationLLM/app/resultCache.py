@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import datetime
+import time
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+from metrics import HitCounter
+
+RESULT_CACHE_ENABLED   = os.environ.get("RESULT_CACHE", "1") != "0"
+RESULT_CACHE_TTL       = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # cached text
+RESULT_CACHE_RESYNC    = 3600           # seconds between recounts of the byte total, see ResultCache
+EVICT_BATCH            = 32             # oldest entries read per eviction query
+INDEX_OPTIONS_CONFLICT = 85             # Mongo error code: index exists with other options
+
+
+def result_key(**parts) -> str:
+    """Deterministic key over everything that decides a greedy generation's output."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class ResultCache:
+    """
+    Generated text and the GridFS id of its rendered PDF, keyed by
+    result_key. Generation is greedy, so an identical request would
+    reproduce the same output; a hit only needs the existing file linked
+    into the session again.
+
+    Entries expire `ttl` seconds after they were written (a Mongo TTL index
+    does the deleting), and the least recently used ones are evicted once
+    the cached text exceeds `max_bytes`. Evicting never deletes the PDF,
+    which sessions still reference.
+
+    The cached text's size is a running total in a one-document companion
+    collection, kept with $inc as entries are written and evicted. Entries
+    the TTL index deletes are not subtracted, so the total is recounted at
+    startup and, when it calls for eviction, at most every RESULT_CACHE_RESYNC
+    seconds.
+    """
+
+    def __init__(self, collection, ttl: int = RESULT_CACHE_TTL, max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 totals=None):
+        self.collection = collection
+        self.totals = totals if totals is not None else collection.database[f"{collection.name}Totals"]
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.counter = HitCounter()
+        self._synced_at = 0.0
+
+    def ensureIndexes(self):
+        try:
+            self.collection.create_index("createdAt", expireAfterSeconds=self.ttl)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                raise
+            # RESULT_CACHE_TTL_SECONDS changed since the index was built; update it in place
+            self.collection.database.command("collMod", self.collection.name,
+                                             index={"keyPattern": {"createdAt": 1},
+                                                    "expireAfterSeconds": self.ttl})
+        self.collection.create_index("lastUsedAt")
+        self._resync()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = _now()
+        # the TTL monitor only runs about once a minute, so check expiry here too
+        doc = self.collection.find_one_and_update(
+            {"_id": key, "createdAt": {"$gt": now - datetime.timedelta(seconds=self.ttl)}},
+            {"$set": {"lastUsedAt": now}},
+        )
+        self.counter.record(doc is not None)
+        return doc
+
+    def put(self, key: str, text: str, gridFsId: str, **fields):
+        now = _now()
+        size = len(text.encode())
+        old = self.collection.find_one_and_replace({"_id": key}, dict(fields, text=text, gridFsId=gridFsId,
+                                                                      bytes=size, createdAt=now, lastUsedAt=now),
+                                                   projection={"bytes": 1}, upsert=True)
+        total = self._add(size - (old["bytes"] if old else 0))
+        if total > self.max_bytes:
+            self._evict(total)
+
+    def drop(self, key: str):
+        doc = self.collection.find_one_and_delete({"_id": key}, projection={"bytes": 1})
+        if doc is not None:
+            self._add(-doc["bytes"])
+
+    def _add(self, delta: int) -> int:
+        """Adjust the running byte total; the new total."""
+        doc = self.totals.find_one_and_update({"_id": "bytes"}, {"$inc": {"bytes": delta}},
+                                              upsert=True, return_document=ReturnDocument.AFTER)
+        return doc["bytes"]
+
+    def _total_bytes(self) -> int:
+        doc = self.totals.find_one({"_id": "bytes"})
+        return doc["bytes"] if doc else 0
+
+    def _resync(self) -> int:
+        """Recount the byte total from the entries themselves."""
+        total = list(self.collection.aggregate([{"$group": {"_id": None, "bytes": {"$sum": "$bytes"}}}]))
+        total = total[0]["bytes"] if total else 0
+        self.totals.replace_one({"_id": "bytes"}, {"bytes": total}, upsert=True)
+        self._synced_at = time.monotonic()
+        return total
+
+    def _evict(self, total: int):
+        if time.monotonic() - self._synced_at > RESULT_CACHE_RESYNC:
+            total = self._resync()
+        excess = total - self.max_bytes
+        while excess > 0:
+            oldest = list(self.collection.find({}, {"bytes": 1}).sort("lastUsedAt", 1).limit(EVICT_BATCH))
+            if not oldest:
+                break
+            for doc in oldest:
+                if excess <= 0:
+                    break
+                # another process may have evicted it already; only count our own deletes
+                if self.collection.delete_one({"_id": doc["_id"]}).deleted_count:
+                    self._add(-doc["bytes"])
+                    excess -= doc["bytes"]
+
+    def stats(self) -> Dict:
+        return {
+            **self.counter.stats(),
+            "entries": self.collection.estimated_document_count(),
+            "bytes": self._total_bytes(),
+            "maxBytes": self.max_bytes,
+        }
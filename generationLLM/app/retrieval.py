@@ -0,0 +1,102 @@
+import os
+import re
+import math
+from collections import Counter
+from typing import Dict, List
+
+import numpy as np
+
+from tokenDoc import TokenizedText
+
+PASSAGE_TOKENS = int(os.environ.get("RETRIEVAL_PASSAGE_TOKENS", "128"))  # generator tokens per passage
+BM25_K1 = 1.5
+BM25_B  = 0.75
+PASSAGE_SEPARATOR = "\n…\n"     # between passages that were not adjacent in the document
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+you your which what when how these those can should must not any such into their there then than
+""".split())
+
+
+def _terms(text: str) -> List[str]:
+    return [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS and len(w) > 1]
+
+
+class PassageIndex:
+    """
+    BM25 index over fixed-size token passages of one document.
+
+    Passages are slices of the document's (memoised) generator ids, so
+    selected passages are reassembled into a prompt without re-tokenising.
+    Built once per request and queried once per generation type.
+    """
+
+    def __init__(self, doc: TokenizedText, tokenizer, passage_tokens: int = PASSAGE_TOKENS):
+        self.doc = doc
+        self.tokenizer = tokenizer
+        ids = doc.ids(tokenizer)
+        self.passages: List[List[int]] = [ids[i:i + passage_tokens]
+                                          for i in range(0, len(ids), passage_tokens)]
+
+        # postings: term -> (passage indices, term frequencies)
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(len(self.passages), dtype=np.float32)
+        for index, passage in enumerate(self.passages):
+            terms = _terms(tokenizer.decode(passage, skip_special_tokens=True))
+            lengths[index] = len(terms)
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, {})[index] = count
+
+        count = len(self.passages)
+        self._norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1.0)) if count else lengths
+        self._postings = {
+            term: (np.fromiter(docs.keys(), dtype=np.int64, count=len(docs)),
+                   np.fromiter(docs.values(), dtype=np.float32, count=len(docs)),
+                   math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5)))
+            for term, docs in postings.items()
+        }
+        self._separator = tokenizer.encode(PASSAGE_SEPARATOR, add_special_tokens=False)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for term in set(_terms(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            indices, tf, idf = posting
+            scores[indices] += idf * tf * (BM25_K1 + 1) / (tf + self._norm[indices])
+        return scores
+
+    def select(self, query: str, max_tokens: int) -> TokenizedText:
+        """
+        The best-scoring passages for `query` that fit in `max_tokens`, in
+        document order. The whole document is returned when it already fits.
+        """
+        if len(self.doc.ids(self.tokenizer)) <= max_tokens:
+            return self.doc
+
+        # stable sort: equal scores keep document order
+        ranked = np.argsort(-self.scores(query), kind="stable")
+        chosen, used = [], 0
+        for index in ranked:
+            if max_tokens - used <= len(self._separator):
+                break
+            cost = len(self.passages[index]) + len(self._separator)
+            if used + cost > max_tokens:
+                continue
+            chosen.append(int(index))
+            used += cost
+
+        ids: List[int] = []
+        previous = None
+        for index in sorted(chosen):
+            if previous is not None and index != previous + 1:
+                ids += self._separator
+            ids += self.passages[index]
+            previous = index
+        return TokenizedText.from_ids(self.tokenizer, ids)
+
+    def __len__(self) -> int:
+        return len(self.passages)
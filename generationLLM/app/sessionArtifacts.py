@@ -0,0 +1,70 @@
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from bson import Binary
+
+from gridfsStream import DOCUMENT_MAX_BYTES
+
+
+def _packIds(ids: List[int]) -> Binary:
+    return Binary(array("i", ids).tobytes())
+
+
+def _unpackIds(packed: bytes) -> List[int]:
+    ids = array("i")
+    ids.frombytes(packed)
+    return ids.tolist()
+
+
+class SessionArtifacts:
+    """
+    Per-session store of what a request derives from each uploaded file:
+    its extracted text and the generator token ids of its context block.
+    The block itself is not stored; it is rebuilt from the text and the
+    file name it was made with.
+
+    One document per (session, GridFS id). GridFS files never change under
+    an id, so an artifact stays valid until the file leaves the session or
+    the extractor/tokenizer changes; a follow-up request only extracts and
+    tokenises files it has no artifact for.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensureIndexes(self):
+        self.collection.create_index([("sessionId", 1), ("gridFsId", 1)], unique=True)
+
+    def load(self, sessionId: str, gridFsIds: Iterable[str], extractorVersion: int) -> Dict[str, Dict]:
+        """Artifacts of the given files that the current extractor produced, by GridFS id."""
+        found = {}
+        for doc in self.collection.find({"sessionId": sessionId,
+                                         "gridFsId": {"$in": list(gridFsIds)},
+                                         "extractorVersion": extractorVersion}):
+            if "blockIds" in doc:
+                doc["blockIds"] = _unpackIds(doc["blockIds"])
+            found[doc["gridFsId"]] = doc
+        return found
+
+    def save(self, sessionId: str, gridFsId: str, extractorVersion: int, text: str,
+             fileName: Optional[str] = None, blockIds: Optional[List[int]] = None, tokenizer: Optional[str] = None):
+        """
+        Store a file's extracted text and, when given, the token ids under
+        `tokenizer` of the context block built from it as `fileName`.
+        """
+        doc = {"sessionId": sessionId, "gridFsId": gridFsId,
+               "extractorVersion": extractorVersion, "text": text}
+        if fileName is not None and blockIds is not None:
+            doc.update(fileName=fileName, blockIds=_packIds(blockIds), tokenizer=tokenizer)
+
+        size = len(text.encode()) + (4 * len(blockIds) if "blockIds" in doc else 0)
+        if size > DOCUMENT_MAX_BYTES:
+            print(f"⚠️  Artifact for {gridFsId} is {size} bytes, not storing it")
+            return
+        self.collection.replace_one({"sessionId": sessionId, "gridFsId": gridFsId}, doc, upsert=True)
+
+    def prune(self, sessionId: str, keepIds: Iterable[str]) -> int:
+        """Drop artifacts of files that are no longer part of the session."""
+        result = self.collection.delete_many({"sessionId": sessionId,
+                                              "gridFsId": {"$nin": list(keepIds)}})
+        return result.deleted_count
@@ -0,0 +1,44 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+
+
+def ensureSessionIndex(users):
+    """
+    Index the embedded session ids so a session can be resolved without
+    scanning the whole users collection.
+    """
+    users.create_index("sessions._id")
+
+
+def findSession(users, session_id: str):
+    """
+    Resolve a session with a single indexed query on `sessions._id`,
+    projecting only the matched session out of its user document.
+    """
+    try:
+        object_id = ObjectId(session_id)
+    except (InvalidId, TypeError):
+        print("❌ Invalid session ID:", session_id)
+        return None
+
+    user = users.find_one(
+        {"sessions._id": object_id},
+        {"sessions": {"$elemMatch": {"_id": object_id}}},
+    )
+    if not user or not user.get("sessions"):
+        print("❌ Session not found")
+        return None
+
+    print("✅ User found with session ID:", session_id)
+    return user["sessions"][0]
+
+
+def addGeneratedFile(users, session_id, entry: dict):
+    """
+    Append an entry to the session's generatedFiles. Matches the session
+    with $elemMatch, which uses the same sessions._id index.
+    """
+    users.update_one(
+        {"sessions": {"$elemMatch": {"_id": ObjectId(session_id)}}},
+        {"$push": {"sessions.$.generatedFiles": entry}}
+    )
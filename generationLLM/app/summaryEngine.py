@@ -0,0 +1,126 @@
+import os
+from concurrent.futures import as_completed
+from typing import Callable, List, Optional
+
+import torch
+
+from modelCache import load_pipeline
+from workerPools import SharedProcessPool
+
+SUMMARISER_ID   = "sshleifer/distilbart-cnn-6-6"
+SUMMARY_BATCH   = int(os.environ.get("SUMMARY_BATCH_SIZE", "4"))   # slices per generate call
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", "1"))      # >1 fans out to processes
+
+
+# ---------------------------------------------------------------------
+#  In-process batched summarisation
+# ---------------------------------------------------------------------
+def summarise_batched(model, tokenizer, slices: List[List[int]],
+                      *,
+                      batch_size: int = SUMMARY_BATCH,
+                      on_batch: Optional[Callable[[int], None]] = None,
+                      **gen_kwargs) -> List[str]:
+    """
+    Summarise token-id slices without decoding them back to text.
+
+    Slices are wrapped in the model's special tokens, right-padded into
+    batches of `batch_size` and fed straight into model.generate().
+    `on_batch(n)` is called with the number of slices each batch finished.
+    """
+    limit  = model.config.max_position_embeddings           # 1024 for distilBART
+    device = model.device                                   # also set on ONNX Runtime models
+
+    partials: List[str] = []
+    for start in range(0, len(slices), batch_size):
+        batch = [tokenizer.build_inputs_with_special_tokens(ids[: limit - 2])
+                 for ids in slices[start:start + batch_size]]
+        padded = tokenizer.pad({"input_ids": batch}, padding=True, return_tensors="pt")
+
+        with torch.inference_mode():
+            out_ids = model.generate(
+                padded["input_ids"].to(device),
+                attention_mask=padded["attention_mask"].to(device),
+                **gen_kwargs,
+            )
+
+        partials.extend(tokenizer.batch_decode(
+            out_ids,
+            skip_special_tokens=True,
+            clean_up_tokenization_spaces=True,
+        ))
+        if on_batch:
+            on_batch(len(batch))
+
+    return partials
+
+
+# ---------------------------------------------------------------------
+#  Process pool: one summariser per worker, torch threads pinned
+# ---------------------------------------------------------------------
+_worker_summarizer = None
+
+def _init_worker(threads: int):
+    global _worker_summarizer
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    _worker_summarizer = load_pipeline("summarization", SUMMARISER_ID)
+
+def _summarise_shard(slices: List[List[int]], batch_size: int, gen_kwargs: dict) -> List[str]:
+    return summarise_batched(_worker_summarizer.model, _worker_summarizer.tokenizer,
+                             slices, batch_size=batch_size, **gen_kwargs)
+
+# torch threads per worker, so the workers split the cores between them
+_worker_threads = int(os.environ.get("SUMMARY_THREADS",
+                                     max(1, (os.cpu_count() or 1) // max(1, SUMMARY_WORKERS))))
+# each worker loads its own summariser; never resized, so small documents do
+# not make the workers reload the model
+_pool = SharedProcessPool(SUMMARY_WORKERS, initializer=_init_worker, initargs=(_worker_threads,))
+
+
+def summarise_slices(slices: List[List[int]],
+                     *,
+                     model=None,
+                     tokenizer=None,
+                     batch_size: int = SUMMARY_BATCH,
+                     shards: int = SUMMARY_WORKERS,
+                     on_progress: Optional[Callable[[int, int], None]] = None,
+                     **gen_kwargs) -> List[str]:
+    """
+    Summarise token-id slices (summariser vocabulary), in order.
+
+    With `shards` <= 1 the given model/tokenizer run in-process. Otherwise
+    the slices are split into up to `shards` contiguous shards for the
+    process pool. `shards` does not size the pool: it always has
+    SUMMARY_WORKERS workers, each pinned to cpu_count / SUMMARY_WORKERS
+    torch threads (SUMMARY_THREADS overrides). `on_progress(done, total)`
+    reports finished slices.
+    """
+    total = len(slices)
+    done = 0
+
+    def _report(n: int):
+        nonlocal done
+        done += n
+        if on_progress:
+            on_progress(done, total)
+
+    if shards <= 1 or total < 2:
+        if model is None or tokenizer is None:
+            raise ValueError("model and tokenizer are required for in-process summarisation")
+        return summarise_batched(model, tokenizer, slices, batch_size=batch_size,
+                                 on_batch=_report, **gen_kwargs)
+
+    pool = _pool.get()
+    shard_len = -(-total // min(shards, total))            # ceil division
+    futures = {
+        pool.submit(_summarise_shard, slices[i:i + shard_len], batch_size, gen_kwargs): i
+        for i in range(0, total, shard_len)
+    }
+
+    shards = {}
+    for future in as_completed(futures):
+        start = futures[future]
+        shards[start] = future.result()
+        _report(len(shards[start]))
+
+    return [part for start in sorted(shards) for part in shards[start]]
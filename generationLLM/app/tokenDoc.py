@@ -0,0 +1,63 @@
+from threading import Lock
+from typing import Dict, List, Optional, Union
+
+
+def tokenizer_key(tokenizer) -> str:
+    return f"{type(tokenizer).__name__}:{tokenizer.name_or_path}"
+
+
+class TokenizedText:
+    """
+    A piece of text that remembers its token ids.
+
+    Ids are computed lazily, once per tokenizer (without special tokens), so
+    one request can count, slice and assemble prompts from the same text
+    with the generator and the summariser without tokenising it twice.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._ids: Dict[str, List[int]] = {}
+        self._lock = Lock()
+
+    @classmethod
+    def from_ids(cls, tokenizer, ids: List[int], text: Optional[str] = None) -> "TokenizedText":
+        """Wrap ids that are already known; the text is decoded only if not given."""
+        if text is None:
+            text = tokenizer.decode(ids, skip_special_tokens=True,
+                                    clean_up_tokenization_spaces=True)
+        doc = cls(text)
+        doc._ids[tokenizer_key(tokenizer)] = ids
+        return doc
+
+    @classmethod
+    def concat(cls, docs: List["TokenizedText"], tokenizer) -> "TokenizedText":
+        """Join docs into one whose ids are their ids end to end (no re-tokenising)."""
+        ids: List[int] = []
+        for doc in docs:
+            ids += doc.ids(tokenizer)
+        return cls.from_ids(tokenizer, ids, "".join(doc.text for doc in docs))
+
+    def ids(self, tokenizer) -> List[int]:
+        key = tokenizer_key(tokenizer)
+        with self._lock:
+            cached = self._ids.get(key)
+        if cached is not None:
+            return cached
+
+        ids = tokenizer.encode(self.text, add_special_tokens=False)
+        with self._lock:
+            return self._ids.setdefault(key, ids)
+
+    def count(self, tokenizer) -> int:
+        return len(self.ids(tokenizer))
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def as_doc(text: Union[str, TokenizedText]) -> TokenizedText:
+    return text if isinstance(text, TokenizedText) else TokenizedText(text)
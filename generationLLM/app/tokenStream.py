@@ -0,0 +1,89 @@
+import os
+import json
+import queue
+import asyncio
+import time
+from contextlib import suppress
+from threading import Event
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+STREAM_BUFFER = int(os.environ.get("STREAM_BUFFER_EVENTS", "64"))  # events buffered per client
+POLL_SECONDS  = 0.5                                                # disconnect check interval while idle
+STALL_SECONDS = float(os.environ.get("STREAM_STALL_SECONDS", "30"))  # a client this far behind is dropped
+
+
+class TokenStream:
+    """
+    Bounded hand-off of server-sent events from a generation job to one client.
+
+    The job thread publishes; the response drains. When the client falls
+    `maxsize` events behind, publish() blocks, which stalls the token
+    streamer and with it model.generate. Once cancelled (the client went
+    away), publish() drops events instead of blocking and `cancelled` is
+    set so the job can stop generating.
+
+    A stalled generate call still holds one of llmUtils' shared generate
+    slots, so a client that stays full for `stall_seconds` is cancelled
+    as if it had disconnected. A client still connected then gets a final
+    `cancelled` event once it has drained what was queued.
+    """
+
+    def __init__(self, maxsize: int = STREAM_BUFFER, stall_seconds: float = STALL_SECONDS):
+        self._queue: "queue.Queue[Optional[Tuple[str, Dict]]]" = queue.Queue(maxsize)
+        self.cancelled = Event()
+        self.stall_seconds = stall_seconds
+
+    def _put(self, item) -> bool:
+        """Queue `item`; False if the stream was cancelled first."""
+        deadline = time.monotonic() + self.stall_seconds
+        while not self.cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    print(f"⚠️  Stream client stalled for {self.stall_seconds:.0f}s, cancelling")
+                    self.cancel()
+        return False
+
+    def publish(self, event: str, data: Dict):
+        self._put((event, data))
+
+    def close(self):
+        """Mark the end of the stream, even a cancelled one."""
+        if not self._put(None):
+            # cancelled streams drop events; make room so events() still ends
+            with suppress(queue.Empty):
+                self._queue.get_nowait()
+            with suppress(queue.Full):
+                self._queue.put_nowait(None)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    async def events(self, is_disconnected: Callable[[], Awaitable[bool]]) -> AsyncIterator[str]:
+        """
+        SSE-formatted events until close(), cancelling if the client
+        disconnects. A stream cancelled while the client is still connected
+        ends with a `cancelled` event once the queue is drained.
+        """
+        try:
+            while True:
+                try:
+                    item = await asyncio.to_thread(self._queue.get, True, POLL_SECONDS)
+                except queue.Empty:
+                    if await is_disconnected():
+                        return
+                    if self.cancelled.is_set():
+                        item = None
+                    else:
+                        continue
+                if item is None:
+                    if self.cancelled.is_set():
+                        yield "event: cancelled\ndata: {}\n\n"
+                    return
+                event, data = item
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            # also reached when the server cancels the response on disconnect
+            self.cancel()
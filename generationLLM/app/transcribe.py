@@ -0,0 +1,139 @@
+import os
+from typing import Iterator, List, NamedTuple, Optional
+
+import numpy as np
+import speech_recognition as sr
+import torch
+
+from modelCache import lazy_pipeline
+from metrics import span
+from workerPools import map_ordered
+
+ASR_MODEL_ID     = os.environ.get("ASR_MODEL", "openai/whisper-tiny.en")
+ASR_WORKERS      = int(os.environ.get("ASR_WORKERS", "2"))              # segments transcribed at once
+ASR_SAMPLE_RATE  = 16_000                       # what Whisper's feature extractor expects
+ASR_MAX_TOKENS   = 440                          # Whisper decodes at most 448 positions per window
+SEGMENT_MAX_SECONDS = 28.0                      # stay inside Whisper's 30 s window
+SEGMENT_MIN_SECONDS = 5.0                       # shorter pauses inside this are not cut on
+SILENCE_DBFS     = float(os.environ.get("ASR_SILENCE_DBFS", "-40"))     # frames quieter than this are silence
+SILENCE_SECONDS  = 0.4                          # a pause this long ends a segment
+FRAME_SECONDS    = 0.03                         # energy is measured per frame
+
+# Loaded on the first audio upload, not at startup
+asr = lazy_pipeline("automatic-speech-recognition", ASR_MODEL_ID)
+
+
+class AudioSegment(NamedTuple):
+    start: float            # seconds from the start of the recording
+    samples: np.ndarray     # mono float32 at ASR_SAMPLE_RATE
+
+
+def _resample(samples: np.ndarray, rate: int) -> np.ndarray:
+    if rate == ASR_SAMPLE_RATE or len(samples) == 0:
+        return samples
+    count = max(1, round(len(samples) * ASR_SAMPLE_RATE / rate))
+    positions = np.linspace(0, len(samples) - 1, count)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def _pcm_samples(buffer: bytes, width: int) -> np.ndarray:
+    """Little-endian PCM samples of `width` bytes as signed int32."""
+    if width == 1:
+        return np.frombuffer(buffer, dtype=np.uint8).astype(np.int32) - 128   # 8-bit WAV samples are unsigned
+    if width == 3:
+        # no 24-bit dtype: pad each sample to 4 bytes as the high bytes of an int32
+        padded = np.zeros((len(buffer) // 3, 4), dtype=np.uint8)
+        padded[:, 1:] = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, 3)
+        return padded.view("<i4").ravel() >> 8
+    return np.frombuffer(buffer, dtype={2: "<i2", 4: "<i4"}[width]).astype(np.int32)
+
+
+def _trailing_silence(silent: List[bool]) -> int:
+    count = 0
+    for quiet in reversed(silent):
+        if not quiet:
+            break
+        count += 1
+    return count
+
+
+def iter_segments(path: str) -> Iterator[AudioSegment]:
+    """
+    Split the recording at `path` on pauses into segments of at most
+    SEGMENT_MAX_SECONDS, reading it a frame at a time. Silence between
+    segments and segments without any speech are dropped.
+    """
+    with sr.AudioFile(path) as source:          # WAV, AIFF or FLAC, read as mono PCM
+        rate, width = source.SAMPLE_RATE, source.SAMPLE_WIDTH
+        scale = float(2 ** (8 * width - 1))
+        threshold = scale * 10 ** (SILENCE_DBFS / 20)
+        frame_size = max(1, int(rate * FRAME_SECONDS))
+        max_frames = int(SEGMENT_MAX_SECONDS / FRAME_SECONDS)
+        min_frames = int(SEGMENT_MIN_SECONDS / FRAME_SECONDS)
+        pause_frames = int(SILENCE_SECONDS / FRAME_SECONDS)
+
+        frames: List[np.ndarray] = []           # the segment being built
+        silent: List[bool] = []                 # per frame of it
+        start = 0.0                             # its start, in seconds
+
+        def take(count: int) -> Optional[AudioSegment]:
+            """Remove the first `count` frames; a segment if they contain speech."""
+            nonlocal frames, silent, start
+            taken, voiced, taken_start = frames[:count], not all(silent[:count]), start
+            frames, silent = frames[count:], silent[count:]
+            start += count * FRAME_SECONDS
+            if not taken or not voiced:
+                return None
+            samples = np.concatenate(taken).astype(np.float32) / scale
+            return AudioSegment(taken_start, _resample(samples, rate))
+
+        while True:
+            buffer = source.stream.read(frame_size)
+            if not buffer:
+                break
+            frame = _pcm_samples(buffer, width)
+            quiet = np.sqrt(np.mean(np.square(frame, dtype=np.float64))) < threshold
+            if not frames and quiet:
+                start += FRAME_SECONDS
+                continue
+            frames.append(frame)
+            silent.append(quiet)
+
+            pause = _trailing_silence(silent)
+            if pause >= pause_frames and len(frames) >= min_frames:
+                segment = take(len(frames) - pause)
+                take(pause)
+            elif len(frames) >= max_frames:
+                # no pause long enough: cut at the last quiet frame past the minimum
+                quiet_at = [i for i in range(min_frames, len(silent)) if silent[i]]
+                segment = take(quiet_at[-1] if quiet_at else len(frames))
+            else:
+                continue
+            if segment is not None:
+                yield segment
+
+        segment = take(len(frames))
+        if segment is not None:
+            yield segment
+
+
+def transcribe_segment(segment: AudioSegment) -> str:
+    """Text of one segment. Called from several threads; uses the model directly, not the pipeline."""
+    with span("transcribe"):
+        features = asr.feature_extractor(segment.samples, sampling_rate=ASR_SAMPLE_RATE,
+                                         return_tensors="pt").input_features
+        with torch.inference_mode():
+            ids = asr.model.generate(features.to(asr.model.device), max_new_tokens=ASR_MAX_TOKENS)
+    return asr.tokenizer.batch_decode(ids, skip_special_tokens=True)[0].strip()
+
+
+def iter_transcript(path: str, *, workers: int = ASR_WORKERS) -> Iterator[str]:
+    """
+    Yield the recording's text segment by segment, in order, as soon as each
+    segment is transcribed. Segments are transcribed `workers` at a time
+    while later ones are still being read and split; at most 2 x `workers`
+    segments are held in memory.
+    """
+    for text in map_ordered(transcribe_segment, iter_segments(path), workers):
+        if text:
+            yield text
@@ -0,0 +1,36 @@
+from typing import Dict, Optional
+
+from metrics import HitCounter
+from gridfsStream import DOCUMENT_MAX_BYTES
+
+
+class TranscriptCache:
+    """
+    Audio transcripts by GridFS id, shared by every session the upload is
+    in. GridFS files never change under an id, so a hit skips reading the
+    recording back out of GridFS as well as transcribing it. An entry only
+    counts for the ASR model and extractor version that produced it.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.counter = HitCounter()
+
+    def get(self, gridFsId: str, model: str, extractorVersion: int) -> Optional[str]:
+        doc = self.collection.find_one({"_id": gridFsId, "model": model,
+                                        "extractorVersion": extractorVersion}, {"text": 1})
+        self.counter.record(doc is not None)
+        return doc["text"] if doc else None
+
+    def put(self, gridFsId: str, model: str, extractorVersion: int, text: str):
+        if len(text.encode()) > DOCUMENT_MAX_BYTES:
+            print(f"⚠️  Transcript of {gridFsId} is too large to cache")
+            return
+        self.collection.replace_one({"_id": gridFsId}, {"model": model, "extractorVersion": extractorVersion,
+                                                        "text": text}, upsert=True)
+
+    def stats(self) -> Dict:
+        return {
+            **self.counter.stats(),
+            "entries": self.collection.estimated_document_count(),
+        }
@@ -0,0 +1,61 @@
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import copy_context
+from threading import Lock
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def submit_in_context(pool: Executor, fn: Callable[..., R], *args) -> "Future[R]":
+    """pool.submit in a copy of the caller's context, so the worker's spans land on the caller's trace."""
+    return pool.submit(copy_context().run, fn, *args)
+
+
+def map_ordered(fn: Callable[[T], R], items: Iterable[T], workers: int) -> Iterator[R]:
+    """
+    Yield fn(item) for each item, in order, computed `workers` at a time on
+    threads. `items` is consumed lazily: at most 2 x `workers` are submitted
+    ahead of the result being yielded, so a large input is never held at once.
+    """
+    workers = max(1, workers)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(submit_in_context(pool, fn, item))
+            while pending and (pending[0].done() or len(pending) >= 2 * workers):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+
+
+class SharedProcessPool:
+    """
+    A spawn-context ProcessPoolExecutor started on first use and kept for the
+    life of the process. It is never resized or shut down while in use, so
+    workers keep whatever their `initializer` loaded.
+    """
+
+    def __init__(self, workers: int, initializer: Optional[Callable] = None, initargs: tuple = ()):
+        self.workers = max(1, workers)
+        self._initializer = initializer
+        self._initargs = initargs
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+
+    def get(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a process that already runs torch threads can deadlock
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=mp.get_context("spawn"),
+                                                 initializer=self._initializer,
+                                                 initargs=self._initargs)
+            return self._pool